@@ -1,14 +1,20 @@
 from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
-import feedparser
+import gc
 import time
-from datetime import datetime
-import urllib.parse
-import ssl
-import requests
-from bs4 import BeautifulSoup
 import re
-import concurrent.futures
+import json
+from news_cache import SnapshotCache
+from metrics import METRICS
+from ingest import IngestRun, resolve_articles
+from news_events import ArticleEvents
+from article_table import date_string
+from news_index import NewsIndex
+from news_store import NewsStore
+from search_index import SearchIndex, tokens as search_tokens
+from static_publish import ENCODINGS, compress, content_hash
+from url_resolver import UrlResolver, CACHE_PATH as URL_CACHE_PATH
+from werkzeug.security import safe_join
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -45,183 +51,283 @@ def requires_auth(f):
         return f(*args, **kwargs)
     return decorated
 
-# SSL fix
-if hasattr(ssl, '_create_unverified_context'):
-    ssl._create_default_https_context = ssl._create_unverified_context
-
-MUNICIPALITIES = [
-    { 'id': 'amami', 'name': '奄美市', 'keywords': ['奄美市'] },
-    { 'id': 'yamato', 'name': '大和村', 'keywords': ['大和村'] },
-    { 'id': 'uken', 'name': '宇検村', 'keywords': ['宇検村'] },
-    { 'id': 'setouchi', 'name': '瀬戸内町', 'keywords': ['瀬戸内町'] },
-    { 'id': 'tatsugo', 'name': '龍郷町', 'keywords': ['龍郷町'] },
-    { 'id': 'kikai', 'name': '喜界町', 'keywords': ['喜界町'] },
-    { 'id': 'tokunoshima', 'name': '徳之島町', 'keywords': ['徳之島町'] },
-    { 'id': 'amagi', 'name': '天城町', 'keywords': ['天城町'] },
-    { 'id': 'isen', 'name': '伊仙町', 'keywords': ['伊仙町'] },
-    { 'id': 'wadomari', 'name': '和泊町', 'keywords': ['和泊町'] },
-    { 'id': 'china', 'name': '知名町', 'keywords': ['知名町', '知名'] }, # Allow "China" without "cho"
-    { 'id': 'yoron', 'name': '与論町', 'keywords': ['与論町', '与論'] }
-]
-
-# Island Definitions (Fallback)
-ISLANDS = [
-    { 'id': 'kikai_jima', 'name': '喜界島', 'keywords': ['喜界島'] },
-    { 'id': 'tokuno_shima', 'name': '徳之島', 'keywords': ['徳之島'] },
-    { 'id': 'okino_erabu', 'name': '沖永良部島', 'keywords': ['沖永良部', '沖永良部島'] },
-    { 'id': 'yoron_jima', 'name': '与論島', 'keywords': ['与論島'] },
-    { 'id': 'kakeroma_jima', 'name': '加計呂麻島', 'keywords': ['加計呂麻島', '加計呂麻'] },
-    { 'id': 'uke_jima', 'name': '請島', 'keywords': ['請島'] },
-    { 'id': 'yoro_shima', 'name': '与路島', 'keywords': ['与路島'] },
-    # Amami Oshima / Generic Amami (Fallback - Lowest Priority)
-    { 'id': 'amami_oshima', 'name': '奄美大島', 'keywords': ['奄美大島', '奄美', '奄美群島'] }
-]
-
-# Strict Source List
-ALLOWED_SOURCES = {
-    'amamishimbun.co.jp': '奄美新聞',
-    'nankainn.com': '南海日日新聞',
-    'amami-minamisantou.keizai.biz': '奄美群島南三島経済新聞',
-    'ryukyushimpo.jp': '琉球新報',
-    '373news.com': '南日本新聞'
-}
-
-# Simplified Strict Source List names (must match RSS source.title approx)
-ALLOWED_SOURCE_NAMES = ['奄美新聞', '南海日日新聞', '奄美群島南三島経済新聞', '琉球新報', '琉球新報デジタル', '南日本新聞']
-
-# Keywords to exclude based on Title
-BLOCK_KEYWORDS = ['tag', 'list', 'category', 'archive', 'writer', 'photo', 'pr', 'ad', 'タグ', '一覧', 'まとめ', 'アーカイブ', '特集', '求人', '人事']
-
-def parse_date(struct_time):
-    if struct_time:
-        return datetime.fromtimestamp(time.mktime(struct_time)).isoformat()
-    return datetime.now().isoformat()
-
-def get_google_news_rss(query):
-    # Construct a query targeting these specific sites
-    site_query = ' OR '.join([f'site:{domain}' for domain in ALLOWED_SOURCES.keys()])
-    full_query = f'"{query}" AND ({site_query})'
-    encoded_query = urllib.parse.quote(full_query)
-    return f"https://news.google.com/rss/search?q={encoded_query}&hl=ja&gl=JP&ceid=JP:ja"
-
-def fetch_feed(target_query):
-    rss_url = get_google_news_rss(target_query)
-    try:
-        # print(f"Fetching RSS for {target_query}")
-        return feedparser.parse(rss_url)
-    except Exception as e:
-        print(f"Error fetching {target_query}: {e}")
-        return None
+def fetch_all_news():
+    print("Fetching news (Parallel Mode with 8 Islands)...")
+    start_time = time.time()
+
+    # Same fetch / filter / classify pipeline as the collector (ingest.py),
+    # without conditional requests: this is a fresh snapshot every time
+    all_articles = list(IngestRun(NEWS_STORE).articles())
+    # Publisher URLs the collector already resolved; no lookups from here
+    all_articles = resolve_articles(all_articles, UrlResolver(URL_CACHE_PATH, max_lookups=0))
+
+    print(f"Entities fetched in {time.time() - start_time:.2f}s")
+    with METRICS.timer('news_stage_seconds', stage='merge'):
+        all_articles.sort(key=lambda x: x['date'], reverse=True)
+    METRICS.inc('news_articles_total', len(all_articles))
+    return all_articles
+
+def build_news_payload():
+    # Serialize once per refresh so serving a request is just writing bytes
+    articles = fetch_all_news()
+    with METRICS.timer('news_stage_seconds', stage='serialize'):
+        return json.dumps(articles, ensure_ascii=False).encode('utf-8')
+
+# Shared snapshot of /api/news (seconds, overridable from the environment)
+NEWS_CACHE = SnapshotCache(
+    build_news_payload,
+    ttl=int(os.environ.get('NEWS_CACHE_TTL', 600)),
+    stale_ttl=int(os.environ.get('NEWS_CACHE_STALE_TTL', 3600)),
+    refresh_interval=int(os.environ.get('NEWS_CACHE_REFRESH_INTERVAL', 900)),
+)
 
 @app.route('/api/news')
 @requires_auth
 def get_news():
-    all_articles = []
-    seen_urls = set()
-    print("Fetching news (Parallel Mode with 8 Islands)...")
-    
-    search_targets = []
-    for m in MUNICIPALITIES: search_targets.append(m['name'])
-    for i in ISLANDS: search_targets.append(i['name'])
-    search_targets = list(set(search_targets))
-    
-    start_time = time.time()
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_query = {executor.submit(fetch_feed, q): q for q in search_targets}
-        
-        for future in concurrent.futures.as_completed(future_to_query):
-            query = future_to_query[future]
-            try:
-                feed = future.result()
-                if not feed: continue
-                
-                for entry in feed.entries:
-                    url = entry.link
-                    if url in seen_urls: continue
-                    article_date = parse_date(entry.published_parsed)
-                    
-                    article_dt = datetime.fromisoformat(article_date)
-                    if (datetime.now() - article_dt).days > 365:
-                        continue
-                        
-                    title = entry.title
-
-                    # 1. Filter by Block Keywords
-
-                    # 1. Filter by Block Keywords
-                    if any(k in title for k in BLOCK_KEYWORDS):
-                        continue
-
-                    # 2. Strict Source Check
-                    source_name = "Google News"
-                    if 'source' in entry and 'title' in entry.source:
-                        source_name = entry.source.title
-                    
-                    if source_name == '琉球新報デジタル': source_name = '琉球新報'
-
-                    if source_name not in ALLOWED_SOURCE_NAMES:
-                        continue
-                    
-                    # Clean title for keyword matching
-                    # Remove the newspaper name if present to avoid false positives (e.g. "Amami...Keizai Shimbun" matching "Amami")
-                    clean_title = title.replace('奄美群島南三島経済新聞', '')
-
-                    # 3. Municipality/Island Assignment Logic
-                    assigned_id = None
-                    assigned_name = None
-                    
-                    # Priority 1: Specific Municipality Match
-                    for muni in MUNICIPALITIES:
-                        # Allow fuzzy "China" (without cho) but use clean_title
-                        if any(kw in clean_title for kw in muni['keywords']):
-                            assigned_id = muni['id']
-                            assigned_name = muni['name']
-                            break 
-                    
-                    # Priority 2: Island Match (Fallback)
-                    if not assigned_id:
-                        for island in ISLANDS:
-                            if any(kw in clean_title for kw in island['keywords']):
-                                assigned_id = island['id']
-                                assigned_name = island['name']
-                                break
-                                
-                    if not assigned_id:
-                        continue
-                    
-                    seen_urls.add(url)
-
-                    image_url = f"https://placehold.co/100x70/0099c6/FFF?text={assigned_name[:2]}"
-                    summary = entry.summary if 'summary' in entry else ""
-                    match = re.search(r'src="([^"]+)"', summary)
-                    if match:
-                        image_url = match.group(1)
-
-                    article = {
-                        'id': entry.guid if 'guid' in entry else entry.link,
-                        'municipalityId': assigned_id,
-                        'MunicipalityName': assigned_name,
-                        'date': parse_date(entry.published_parsed),
-                        'title': title, # Keep original title for display
-                        'content': summary[:100] + '...',
-                        'source': source_name,
-                        'imageUrl': image_url,
-                        'url': url
-                    }
-                    all_articles.append(article)
-            except Exception as e:
-                print(f"Error processing {query}: {e}")
+    payload, status = NEWS_CACHE.get()
+    if payload is None:
+        return jsonify({'error': 'News is not available yet'}), 503
 
-    print(f"Entities fetched in {time.time() - start_time:.2f}s")
-    all_articles.sort(key=lambda x: x['date'], reverse=True)
-    return jsonify(all_articles)
+    response = Response(payload, mimetype='application/json')
+    response.headers['X-Cache'] = status
+    response.headers['X-Cache-Age'] = str(int(NEWS_CACHE.age() or 0))
+    return response
+
+@app.route('/metrics')
+@requires_auth
+def metrics():
+    return Response(METRICS.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/health')
+def health():
+    return jsonify({'news': NEWS_CACHE.health(), 'streams': ARTICLE_EVENTS.clients})
+
+# Collected archive (monthly shards) and an indexed view of it,
+# rebuilt in the background when the collector publishes a new manifest
+NEWS_STORE = NewsStore('news_data')
+NEWS_INDEX = NewsIndex(NEWS_STORE)
+
+# Index at import: under `gunicorn --preload` the workers fork with it and
+# share its pages, and gc.freeze() keeps the collector from writing to them
+NEWS_INDEX.reload_if_changed()
+# Ranked keyword search (search_index.py): a file every worker maps; built
+# or caught up here if the collector hasn't
+SEARCH_INDEX = SearchIndex()
+SEARCH_INDEX.refresh(NEWS_STORE)
+gc.freeze()
+
+def reindex():
+    # Off the request path: the rebuilds are CPU-bound and would hold up
+    # every greenlet of the worker. Both yield as they go (news_store.cooperative).
+    NEWS_INDEX.reload_if_changed()
+    SEARCH_INDEX.refresh(NEWS_STORE)
+
+# Newly collected articles pushed to open pages (Server-Sent Events).
+# Idle streams are cheap under the gevent worker (gunicorn.conf.py).
+# Its manifest watcher is also the change signal for both indexes.
+ARTICLE_EVENTS = ArticleEvents(NEWS_STORE, on_change=reindex)
+
+@app.before_request
+def start_watcher():
+    ARTICLE_EVENTS.start()  # once per worker, after the fork
+
+def _list_arg(name):
+    values = []
+    for v in request.args.getlist(name):
+        values.extend(x for x in v.split(',') if x)
+    return values
+
+@app.route('/api/news/query')
+@requires_auth
+def query_news():
+    try:
+        limit = max(0, min(int(request.args.get('limit', 50)), 500))
+        items, next_cursor = NEWS_INDEX.query(
+            municipalities=_list_arg('municipality'),
+            sources=_list_arg('source'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            keyword=request.args.get('q'),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'items': items, 'nextCursor': next_cursor})
+
+@app.route('/api/news/search')
+@requires_auth
+def search_news():
+    q = request.args.get('q', '')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 200))
+        if not search_tokens(q):
+            # A single character has no bigrams to rank by: newest matches instead
+            items, _ = NEWS_INDEX.query(
+                municipalities=_list_arg('municipality'),
+                sources=_list_arg('source'),
+                start=request.args.get('start'),
+                end=request.args.get('end'),
+                keyword=q,
+                limit=limit,
+            )
+            return jsonify({'items': [dict(a, score=None) for a in items]})
+        hits = SEARCH_INDEX.search(
+            q,
+            municipalities=_list_arg('municipality'),
+            sources=_list_arg('source'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            limit=limit,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    items = []
+    for score, date, url in hits:
+        article = NEWS_INDEX.get(date_string(date), url)
+        if article is not None:  # gone since, e.g. compacted into a cold month
+            items.append(dict(article, score=score))
+    return jsonify({'items': items})
+
+@app.route('/api/news/since')
+@requires_auth
+def news_since():
+    # Articles ingested after `cursor` (the manifest / previous response seq),
+    # so a returning client only downloads what's new.
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = max(1, min(int(request.args.get('limit', 500)), 2000))
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be integers'}), 400
+
+    latest = NEWS_STORE.manifest().get('seq', 0)
+    if cursor > latest:
+        # Cursor from another archive (e.g. after a reset): client must reload
+        return jsonify({'error': 'Unknown cursor', 'cursor': latest}), 410
+
+    items = NEWS_STORE.load_since(cursor, limit + 1)
+    more = len(items) > limit
+    items = items[:limit]
+    next_cursor = items[-1]['seq'] if items else cursor
+    return jsonify({'items': items, 'cursor': next_cursor, 'more': more})
+
+@app.route('/api/news/stream')
+@requires_auth
+def news_stream():
+    # EventSource sends the last event id (a seq) when it reconnects
+    try:
+        cursor = int(request.headers.get('Last-Event-ID') or request.args.get('cursor', 0))
+    except ValueError:
+        return jsonify({'error': 'cursor must be an integer'}), 400
+    return Response(ARTICLE_EVENTS.stream(cursor), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Precompressed static delivery ---
+# Hashed shard names (YYYY-MM.<hash>.json) never change content: cache forever.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{16}\.json$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+# path -> ((mtime, size), etag, {encoding: bytes or path of the precompressed file})
+_static_variants = {}
+
+def _static_entry(path):
+    stat = os.stat(path)
+    key = (stat.st_mtime, stat.st_size)
+    cached = _static_variants.get(path)
+    if cached and cached[0] == key:
+        return cached
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = {}
+    for encoding, suffix in ENCODINGS:
+        variant_path = path + suffix
+        if os.path.exists(variant_path) and os.path.getmtime(variant_path) >= stat.st_mtime:
+            variants[encoding] = variant_path  # written by the collector
+        else:
+            compressed = compress(data, encoding)  # e.g. index.html, done once per change
+            if compressed is not None:
+                variants[encoding] = compressed
+    entry = (key, content_hash(data), variants)
+    _static_variants[path] = entry
+    return entry
+
+def send_precompressed(path, mimetype, immutable=False):
+    if not path or not os.path.isfile(path):
+        return jsonify({'error': 'Not found'}), 404
+    _, digest, variants = _static_entry(path)
+
+    encoding = None
+    for candidate, _ in ENCODINGS:
+        if candidate in variants and request.accept_encodings[candidate] > 0:
+            encoding = candidate
+            break
+
+    etag = f'{digest}-{encoding}' if encoding else digest
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+        'Vary': 'Accept-Encoding',
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    if encoding is None:
+        with open(path, 'rb') as f:
+            body = f.read()
+    else:
+        body = variants[encoding]
+        if isinstance(body, str):
+            with open(body, 'rb') as f:
+                body = f.read()
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype=mimetype, headers=headers)
 
 @app.route('/news_data/<path:filename>')
 @requires_auth
 def serve_news_data(filename):
+    # Published artifacts: minified by the collector, precompressed by the
+    # deploy build or else compressed here on first request
+    if filename.startswith('dist/'):
+        return send_precompressed(safe_join('news_data', filename), 'application/json',
+                                  immutable=bool(HASHED_NAME.search(filename)))
+
+    # Legacy single-file archive, assembled from the shards.
+    # ?days=N limits it to the last N days.
+    if filename == 'news.json' and not os.path.exists(NEWS_STORE.legacy_path):
+        days = request.args.get('days', type=int)
+        articles = NEWS_STORE.load_recent(days) if days else NEWS_STORE.load()
+        return Response(json.dumps(articles, ensure_ascii=False), mimetype='application/json')
     return send_from_directory('news_data', filename)
 
+# --- Thumbnails ---
+# Article images downsized and kept on disk at build time (thumbnails.py);
+# this only looks them up, it never fetches. Created on first use: PIL
+# isn't needed to serve the archive.
+THUMBNAILS = None
+
+@app.route('/api/thumb')
+@requires_auth
+def serve_thumbnail():
+    global THUMBNAILS
+    from thumbnails import MIMETYPE as THUMB_MIMETYPE, ThumbnailCache
+    if THUMBNAILS is None:
+        THUMBNAILS = ThumbnailCache()
+
+    found = THUMBNAILS.lookup(request.args.get('src', ''))
+    if found is None:
+        return jsonify({'error': 'Image unavailable'}), 404
+
+    digest, path = found
+    # A source URL always maps to the same thumbnail
+    headers = {'ETag': f'"{digest}"', 'Cache-Control': IMMUTABLE_CACHE}
+    if request.if_none_match.contains(digest):
+        return Response(status=304, headers=headers)
+    with open(path, 'rb') as f:
+        return Response(f.read(), mimetype=THUMB_MIMETYPE, headers=headers)
+
 @app.route('/favicon.png')
 @requires_auth
 def serve_favicon():
@@ -230,7 +336,7 @@ def serve_favicon():
 @app.route('/')
 @requires_auth
 def index():
-    return send_from_directory('.', 'index.html')
+    return send_precompressed('index.html', 'text/html')
 
 if __name__ == '__main__':
     print("Server starting on http://localhost:5000")
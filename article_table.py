@@ -0,0 +1,175 @@
+import bisect
+from array import array
+from datetime import datetime, timedelta
+
+# Naive local datetimes, stored as microseconds since this point
+EPOCH = datetime(1970, 1, 1)
+
+# What the collector puts in imageUrl when the feed has no picture
+PLACEHOLDER_IMAGE = 'https://placehold.co/100x70/0099c6/FFF?text={}'
+PLACEHOLDER_PREFIX = PLACEHOLDER_IMAGE.split('{}')[0]
+
+# Google News summaries are usually just a link to the article, which the
+# collector cuts to 100 characters
+LINK_SUMMARY = '<a href="{}'
+SUMMARY_LENGTH = 100
+
+FIELDS = ['id', 'municipalityId', 'MunicipalityName', 'date', 'title', 'content',
+          'source', 'imageUrl', 'url']
+
+
+def date_key(iso):
+    """ISO date(time) string -> int, ordered like the strings."""
+    delta = datetime.fromisoformat(iso) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def date_string(key):
+    return (EPOCH + timedelta(microseconds=key)).isoformat()
+
+
+def link_summary(url):
+    return LINK_SUMMARY.format(url)[:SUMMARY_LENGTH] + '...'
+
+
+class StringColumn:
+    """Strings packed into one UTF-8 buffer plus an offset array.
+
+    Two objects however many rows, so a forked worker touching the column
+    doesn't copy pages full of per-string refcounts.
+    """
+    __slots__ = ('data', 'offsets')
+
+    def __init__(self, values):
+        encoded = [v.encode('utf-8') for v in values]
+        self.offsets = array('Q', [0])
+        total = 0
+        for e in encoded:
+            total += len(e)
+            self.offsets.append(total)
+        self.data = b''.join(encoded)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def nbytes(self):
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+
+class CategoryColumn:
+    """Repeated values (municipality, source...) stored once, rows hold a code."""
+    __slots__ = ('values', 'codes')
+
+    def __init__(self, values):
+        lookup = {}
+        self.values = []
+        codes = []
+        for v in values:
+            code = lookup.get(v)
+            if code is None:
+                code = lookup[v] = len(self.values)
+                self.values.append(v)
+            codes.append(code)
+        self.codes = array('B' if len(self.values) <= 256 else 'H', codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes)
+
+
+class ArticleTable:
+    """Read-only, column-per-field copy of a list of article dicts.
+
+    Rows come back as plain dicts (row(i)), identical to what went in.
+    Values that can be rebuilt from other fields are not stored: Google
+    News URLs are '<prefix><id><suffix>', link-only summaries are cut from
+    the URL, and placeholder images come from the municipality name. For
+    those rows the string columns hold ''.
+    """
+    __slots__ = ('ids', 'urls', 'url_affixes', 'titles', 'contents', 'images',
+                 'municipality_ids', 'municipality_names', 'sources', 'dates', 'seqs')
+
+    def __init__(self, articles):
+        urls = []
+        affixes = []
+        contents = []
+        images = []
+        for a in articles:
+            url = a['url']
+            start = url.find(a['id']) if a['id'] else -1
+            if start >= 0:
+                affixes.append((url[:start], url[start + len(a['id']):]))
+                urls.append('')
+            else:
+                affixes.append(None)
+                urls.append(url)
+            contents.append('' if a['content'] == link_summary(url) else a['content'])
+            placeholder = PLACEHOLDER_IMAGE.format(a['MunicipalityName'][:2])
+            images.append('' if a['imageUrl'] == placeholder else a['imageUrl'])
+
+        self.ids = StringColumn(a['id'] for a in articles)
+        self.urls = StringColumn(urls)
+        self.url_affixes = CategoryColumn(affixes)
+        self.titles = StringColumn(a['title'] for a in articles)
+        self.contents = StringColumn(contents)
+        self.images = StringColumn(images)
+        self.municipality_ids = CategoryColumn(a['municipalityId'] for a in articles)
+        self.municipality_names = CategoryColumn(a['MunicipalityName'] for a in articles)
+        self.sources = CategoryColumn(a['source'] for a in articles)
+        self.dates = array('q', (date_key(a['date']) for a in articles))
+        # 0 = stored before sequencing, no 'seq' key
+        self.seqs = array('Q', (a.get('seq', 0) for a in articles))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def url(self, i):
+        affix = self.url_affixes[i]
+        if affix is None:
+            return self.urls[i]
+        return affix[0] + self.ids[i] + affix[1]
+
+    def content(self, i):
+        return self.contents[i] or link_summary(self.url(i))
+
+    def image(self, i):
+        return self.images[i] or PLACEHOLDER_IMAGE.format(self.municipality_names[i][:2])
+
+    def row(self, i):
+        url = self.url(i)
+        article = {
+            'id': self.ids[i],
+            'municipalityId': self.municipality_ids[i],
+            'MunicipalityName': self.municipality_names[i],
+            'date': date_string(self.dates[i]),
+            'title': self.titles[i],
+            'content': self.contents[i] or link_summary(url),
+            'source': self.sources[i],
+            'imageUrl': self.image(i),
+            'url': url,
+        }
+        if self.seqs[i]:
+            article['seq'] = self.seqs[i]
+        return article
+
+    def position(self, date, url):
+        """First row at or after (date, url), for a table sorted by that key."""
+        key = date_key(date)
+        pos = bisect.bisect_left(self.dates, key)
+        end = bisect.bisect_right(self.dates, key, lo=pos)
+        while pos < end and self.url(pos) < url:
+            pos += 1
+        return pos
+
+    def nbytes(self):
+        """Approximate size of the column data, without Python object overhead."""
+        columns = [getattr(self, name) for name in self.__slots__]
+        return sum(c.nbytes() if hasattr(c, 'nbytes') else c.itemsize * len(c) for c in columns)
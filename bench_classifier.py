@@ -0,0 +1,63 @@
+"""Micro-benchmark: compiled location classifier vs the old keyword loops.
+
+Runs both over every title in the collected archive, checks they agree and
+prints the time per title.
+
+    python bench_classifier.py [repeat]
+"""
+import sys
+import time
+
+from locations import MUNICIPALITIES, ISLANDS, BLOCK_KEYWORDS, classify_locations
+from news_store import NewsStore
+
+
+def legacy_classify(title):
+    # The loops collect_news.py / app.py used before locations.py
+    blocked = any(k in title for k in BLOCK_KEYWORDS)
+    clean_title = title.replace('奄美群島南三島経済新聞', '')
+    for muni in MUNICIPALITIES:
+        if any(kw in clean_title for kw in muni['keywords']):
+            return muni, blocked
+    for island in ISLANDS:
+        if any(kw in clean_title for kw in island['keywords']):
+            return island, blocked
+    return None, blocked
+
+
+def best_of(fn, titles, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(titles)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    titles = [a['title'] for a in NewsStore('news_data').load()]
+    if not titles:
+        print("No articles in news_data, run collect_news.py first.")
+        return
+
+    old = [legacy_classify(t) for t in titles]
+    new = classify_locations(titles)
+    mismatches = [(t, o, n) for t, o, n in zip(titles, old, new)
+                  if (o[0] and o[0]['id'], o[1]) != (n[0] and n[0]['id'], n[1])]
+
+    legacy_time = best_of(lambda ts: [legacy_classify(t) for t in ts], titles, repeat)
+    compiled_time = best_of(classify_locations, titles, repeat)
+
+    print(f"Titles: {len(titles)} (best of {repeat})")
+    print(f"Legacy loops : {legacy_time * 1000:8.2f} ms  {legacy_time / len(titles) * 1e6:6.2f} us/title")
+    print(f"Compiled     : {compiled_time * 1000:8.2f} ms  {compiled_time / len(titles) * 1e6:6.2f} us/title")
+    print(f"Speedup      : {legacy_time / compiled_time:.2f}x")
+    print(f"Mismatches   : {len(mismatches)}")
+    for title, o, n in mismatches[:10]:
+        print(f"  {title}\n    legacy={o[0] and o[0]['id']} compiled={n[0] and n[0]['id']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Micro-benchmark: per-entry feed processing, streaming loop vs the old one.
+
+Builds a feed from the collected archive plus a copy of it aged past the
+365-day cutoff, parses it once with feedparser, then runs both entry loops
+over it, checks they keep the same articles and prints CPU time and peak
+memory per entry while streaming. The feed is run twice: newest first (the
+walk can stop at the cutoff) and shuffled.
+
+    python bench_entries.py [repeat]
+"""
+import random
+import re
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+
+from ingest import ALLOWED_SOURCE_NAMES, iter_articles, parse_date, parse_feed, source_name
+from locations import classify_location
+from metrics import StageTimer
+from news_store import NewsStore
+from stub_feed_server import make_rss
+
+
+def legacy_articles(entries, seen_urls, dropped, stages):
+    # The loop app.py / collect_news.py ran before ingest.iter_articles
+    for entry in entries:
+        url = entry.link
+        if url in seen_urls:
+            dropped['duplicate'] += 1
+            continue
+        article_date = parse_date(entry.published_parsed)
+
+        article_dt = datetime.fromisoformat(article_date)
+        if (datetime.now() - article_dt).days > 365:
+            dropped['age'] += 1
+            continue
+
+        title = entry.title
+        with stages('classify'):
+            location, blocked = classify_location(title)
+        if blocked:
+            dropped['blocked'] += 1
+            continue
+
+        source = source_name(entry)
+        if source not in ALLOWED_SOURCE_NAMES:
+            dropped['source'] += 1
+            continue
+
+        if not location:
+            dropped['location'] += 1
+            continue
+
+        seen_urls.add(url)
+
+        image_url = f"https://placehold.co/100x70/0099c6/FFF?text={location['name'][:2]}"
+        summary = entry.summary if 'summary' in entry else ""
+        match = re.search(r'src="([^"]+)"', summary)
+        if match:
+            image_url = match.group(1)
+
+        yield {
+            'id': entry.guid if 'guid' in entry else entry.link,
+            'municipalityId': location['id'],
+            'MunicipalityName': location['name'],
+            'date': parse_date(entry.published_parsed),
+            'title': title,
+            'content': summary[:100] + '...',
+            'source': source,
+            'imageUrl': image_url,
+            'url': url
+        }
+
+
+def corpus(archive, shuffle):
+    old = [dict(a, id=a['id'] + '#old', url=a['url'] + '#old',
+                date=(datetime.fromisoformat(a['date']) - timedelta(days=400)).isoformat())
+           for a in archive]
+    articles = sorted(archive + old, key=lambda a: a['date'], reverse=True)
+    if shuffle:
+        random.Random(1).shuffle(articles)
+    return parse_feed(make_rss(articles)).entries
+
+
+def measure(loop, entries, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        kept = list(loop(entries, set(), Counter(), StageTimer()))
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Transient memory while streaming, articles dropped as they come
+    tracemalloc.start()
+    for _ in loop(entries, set(), Counter(), StageTimer()):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, kept
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    archive = NewsStore('news_data').load()
+    if not archive:
+        print("No articles in news_data, run collect_news.py first.")
+        return
+
+    for label, shuffle in (('newest first', False), ('shuffled', True)):
+        entries = corpus(archive, shuffle)
+        n = len(entries)
+        old_time, old_peak, old_kept = measure(legacy_articles, entries, repeat)
+        new_time, new_peak, new_kept = measure(iter_articles, entries, repeat)
+        mismatches = sum(1 for o, k in zip(old_kept, new_kept) if o != k) + abs(len(old_kept) - len(new_kept))
+
+        print(f"{label}: {n} entries, {len(new_kept)} kept (best of {repeat})")
+        print(f"  Legacy loop : {old_time / n * 1e6:6.2f} us/entry  {old_peak / n:7.1f} B/entry peak")
+        print(f"  Streaming   : {new_time / n * 1e6:6.2f} us/entry  {new_peak / n:7.1f} B/entry peak")
+        print(f"  Speedup     : {old_time / new_time:.2f}x, mismatches: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
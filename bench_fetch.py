@@ -0,0 +1,61 @@
+"""Benchmark: legacy thread pool + feedparser.parse(url) vs the async fetcher.
+
+Both fetch the 20 place queries from a local stub server (stub_feed_server.py)
+that adds a fixed latency per request. Prints wall-clock time, TCP connections
+opened and how many feeds came back with entries.
+
+    python bench_fetch.py [latency_seconds] [fail_first] [per_host]
+"""
+import concurrent.futures
+import sys
+import time
+import urllib.parse
+
+import feedparser
+
+from async_fetch import PER_HOST_LIMIT, fetch_feeds
+from locations import MUNICIPALITIES, ISLANDS
+from stub_feed_server import StubFeedServer
+
+
+def feed_urls(base_url):
+    queries = sorted({loc['name'] for loc in MUNICIPALITIES + ISLANDS})
+    return [f"{base_url}/rss/search?q={urllib.parse.quote(q)}&hl=ja" for q in queries]
+
+
+def legacy_fetch(urls):
+    # What collect_news.py / app.py did before async_fetch.py
+    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+        feeds = list(executor.map(feedparser.parse, urls))
+    return sum(1 for f in feeds if f.entries)
+
+
+def async_fetch(urls, per_host):
+    results = fetch_feeds(urls, per_host=per_host)
+    return sum(1 for r in results.values() if r.ok and feedparser.parse(r.content).entries)
+
+
+def run(name, fn, latency, fail_first):
+    server = StubFeedServer(latency=latency, fail_first=fail_first).start()
+    try:
+        urls = feed_urls(server.base_url)
+        start = time.perf_counter()
+        ok = fn(urls)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<14} {elapsed:7.2f}s  connections={server.connections:<3} "
+              f"requests={sum(server.request_counts.values()):<3} feeds_ok={ok}/{len(urls)}")
+    finally:
+        server.stop()
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.3
+    fail_first = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    per_host = int(sys.argv[3]) if len(sys.argv) > 3 else PER_HOST_LIMIT
+    print(f"Stub latency {latency}s per request, first {fail_first} request(s) per feed fail with 503")
+    run('thread pool', legacy_fetch, latency, fail_first)
+    run(f'async x{per_host}', lambda urls: async_fetch(urls, per_host), latency, fail_first)
+
+
+if __name__ == '__main__':
+    main()
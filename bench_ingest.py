@@ -0,0 +1,317 @@
+"""Offline benchmark of the whole ingest pipeline on recorded RSS fixtures.
+
+Replays one feed per place query from a local stub server through the real
+collector (fetch -> parse -> filter -> classify -> merge -> write), then
+times the /api/news refresh and cached responses. The pipeline runs in a
+fresh process so its peak RSS isn't mixed with the stub's.
+
+    python bench_ingest.py record                 # capture live Google News feeds
+    python bench_ingest.py synth --entries 100000 # build fixtures from the archive
+    python bench_ingest.py run [--entries N | --fixtures DIR] [--save] [--compare FILE]
+
+Synthetic fixtures replay archived articles into the feeds of the places
+they mention, copied with unique URLs and spread over the last year until
+the requested number of feed entries is reached. Results are JSON files in
+bench_results/; --compare reports changes against an earlier one and exits
+non-zero on a regression beyond --threshold.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+from email.utils import format_datetime
+
+from locations import MUNICIPALITIES, ISLANDS
+from news_store import NewsStore
+from stub_feed_server import StubFeedServer, query_places
+
+FIXTURE_DIR = 'bench_fixtures'
+RESULT_DIR = 'bench_results'
+API_REQUESTS = 200
+GOOGLE_ARTICLES = b'https://news.google.com/rss/articles/'
+
+RSS_HEAD = '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>fixture</title>'
+RSS_TAIL = '</channel></rss>'
+
+
+def place_names():
+    return sorted({loc['name'] for loc in MUNICIPALITIES + ISLANDS})
+
+
+def write_index(fixture_dir, files, **info):
+    with open(os.path.join(fixture_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(info, files=files), f, ensure_ascii=False, indent=2)
+
+
+def load_index(fixture_dir):
+    with open(os.path.join(fixture_dir, 'index.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# --- Fixtures ---
+
+def record(fixture_dir):
+    """Saves the current live feed of every place query."""
+    from async_fetch import fetch_feeds
+    from ingest import get_google_news_rss
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    urls = {get_google_news_rss(name): name for name in place_names()}
+    results = fetch_feeds(list(urls))
+    files = {}
+    for i, (url, name) in enumerate(sorted(urls.items(), key=lambda x: x[1])):
+        result = results[url]
+        if not result.ok:
+            print(f"Skipping {name}: {result.error}")
+            continue
+        filename = f'{i:02d}.xml'
+        with open(os.path.join(fixture_dir, filename), 'wb') as f:
+            f.write(result.content)
+        files[name] = filename
+    write_index(fixture_dir, files, kind='recorded', recorded=datetime.now().isoformat(timespec='seconds'))
+    print(f"Recorded {len(files)} feeds to {fixture_dir}")
+
+
+def _rss_item(article, date):
+    return ('<item>'
+            f'<title>{escape(article["title"])}</title>'
+            f'<link>{escape(article["url"])}</link>'
+            f'<guid isPermaLink="false">{escape(article["id"])}</guid>'
+            f'<pubDate>{format_datetime(date)}</pubDate>'
+            f'<description>{escape(article.get("content", ""))}</description>'
+            f'<source url="https://example.com">{escape(article["source"])}</source>'
+            '</item>')
+
+
+def synthesize(fixture_dir, entries, seed=1):
+    """Builds one feed per place from the archive, scaled to `entries` feed items."""
+    archive = NewsStore('news_data').load()
+    if not archive:
+        sys.exit("No archive in news_data to build fixtures from.")
+    names = place_names()
+    rng = random.Random(seed)
+    now = datetime.now().astimezone().replace(microsecond=0)
+
+    # Each article shows up in the feed of its own place and of any place its title names
+    feeds_for = []
+    for a in archive:
+        feeds = {n for n in names if n in a['title']}
+        feeds.add(a['MunicipalityName'])
+        feeds_for.append(sorted(feeds & set(names)))
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    files = {name: f'{i:02d}.xml' for i, name in enumerate(names)}
+    handles = {name: open(os.path.join(fixture_dir, files[name]), 'w', encoding='utf-8') for name in names}
+    for f in handles.values():
+        f.write(RSS_HEAD)
+
+    written = 0
+    articles = 0
+    copy = 0
+    while written < entries:
+        for a, feeds in zip(archive, feeds_for):
+            if written >= entries:
+                break
+            if copy:
+                # Distinct token and headline, or the copies resolve to one story
+                new_id = f"{a['id']}x{copy}"
+                a = dict(a, id=new_id, url=a['url'].replace(a['id'], new_id), title=f"[{copy}] {a['title']}")
+            date = now - timedelta(seconds=rng.randrange(360 * 86400))
+            item = _rss_item(a, date)
+            for name in feeds:
+                handles[name].write(item)
+            written += len(feeds)
+            articles += 1
+        copy += 1
+
+    for f in handles.values():
+        f.write(RSS_TAIL)
+        f.close()
+    write_index(fixture_dir, files, kind='synthetic', entries=written, articles=articles, seed=seed)
+    print(f"Wrote {written} feed entries ({articles} articles) to {fixture_dir}")
+
+
+# --- Run ---
+
+def _pipeline(base_url, workdir, queue):
+    # Runs in a fresh process: point the collector at the stub, collect, then
+    # time the /api/news refresh and a burst of cached requests.
+    os.environ['GOOGLE_NEWS_RSS_URL'] = f'{base_url}/rss/search'
+    os.chdir(workdir)
+
+    import collect_news
+    from metrics import METRICS
+
+    start = time.perf_counter()
+    collect_news.collect_news()
+    collect_seconds = time.perf_counter() - start
+    snapshot = METRICS.snapshot()
+    collect_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    import app
+    start = time.perf_counter()
+    app.NEWS_CACHE.refresh()
+    refresh_seconds = time.perf_counter() - start
+
+    client = app.app.test_client()
+    latencies = []
+    for _ in range(API_REQUESTS):
+        t = time.perf_counter()
+        client.get('/api/news')
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+
+    with open(collect_news.RUN_REPORT_PATH, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+
+    queue.put({
+        'collectSeconds': collect_seconds,
+        'collectPeakRssKb': collect_rss,
+        'snapshot': snapshot,
+        'report': report,
+        'api': {
+            'refreshSeconds': round(refresh_seconds, 3),
+            'p50Ms': round(latencies[len(latencies) // 2] * 1000, 3),
+            'p99Ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        },
+    })
+
+
+def run(fixture_dir):
+    index = load_index(fixture_dir)
+    files = index['files']
+
+    def body(query):
+        # Grouped queries get the first place's feed; the collector starts
+        # from an empty store, so it plans one query per place anyway.
+        # Article links go to the stub too, so URL resolution stays local.
+        for name in query_places(query):
+            if name in files:
+                with open(os.path.join(fixture_dir, files[name]), 'rb') as f:
+                    return f.read().replace(GOOGLE_ARTICLES, f'{server.base_url}/rss/articles/'.encode())
+        return (RSS_HEAD + RSS_TAIL).encode('utf-8')
+
+    server = StubFeedServer(body=body).start()
+    workdir = tempfile.mkdtemp(prefix='bench_ingest_')
+    try:
+        ctx = multiprocessing.get_context('spawn')
+        queue = ctx.Queue()
+        process = ctx.Process(target=_pipeline, args=(server.base_url, workdir, queue))
+        process.start()
+        raw = queue.get()
+        process.join()
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    stages = {}
+    for t in raw['snapshot']['timings']:
+        if t['name'] == 'news_stage_seconds':
+            stage = t['labels']['stage']
+            stages[stage] = round(stages.get(stage, 0) + t['seconds'], 4)
+    drops = {c['labels']['reason']: c['value'] for c in raw['snapshot']['counters']
+             if c['name'] == 'news_entries_dropped_total'}
+    entries = sum(c['value'] for c in raw['snapshot']['counters'] if c['name'] == 'news_entries_total')
+
+    return {
+        'benchmark': 'ingest',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'fixtures': {k: v for k, v in index.items() if k != 'files'},
+        'entries': entries,
+        'articles': raw['report']['newArticles'],
+        'seconds': round(raw['collectSeconds'], 3),
+        'entriesPerSecond': round(entries / raw['collectSeconds'], 1) if raw['collectSeconds'] else None,
+        'peakRssMb': round(raw['collectPeakRssKb'] / 1024, 1),
+        'stages': stages,
+        'drops': drops,
+        'api': raw['api'],
+    }
+
+
+def print_result(result):
+    print(f"Entries: {result['entries']}  articles kept: {result['articles']}")
+    print(f"Collect: {result['seconds']}s  ({result['entriesPerSecond']} entries/s), peak RSS {result['peakRssMb']} MB")
+    print("Stages (s): " + ', '.join(f"{k}={v}" for k, v in sorted(result['stages'].items())))
+    print("Drops: " + ', '.join(f"{k}={v}" for k, v in sorted(result['drops'].items())))
+    api = result['api']
+    print(f"/api/news: refresh {api['refreshSeconds']}s, cached p50 {api['p50Ms']}ms p99 {api['p99Ms']}ms")
+
+
+def compare(result, baseline_path, threshold):
+    """Prints changes against a saved result. Returns True if something regressed."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    # (label, current, baseline, higher is better)
+    checks = [
+        ('entries/s', result['entriesPerSecond'], baseline['entriesPerSecond'], True),
+        ('peak RSS MB', result['peakRssMb'], baseline['peakRssMb'], False),
+        ('api refresh s', result['api']['refreshSeconds'], baseline['api']['refreshSeconds'], False),
+        ('api p99 ms', result['api']['p99Ms'], baseline['api']['p99Ms'], False),
+    ]
+    for stage, seconds in sorted(result['stages'].items()):
+        if stage in baseline['stages']:
+            checks.append((f'stage {stage} s', seconds, baseline['stages'][stage], False))
+
+    regressed = False
+    print(f"\nCompared with {baseline_path}:")
+    for label, current, base, higher_is_better in checks:
+        if not base:
+            continue
+        change = (current - base) / base
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"  {label:<16} {base:>12} -> {current:<12} {change:+.1%}{flag}")
+    if baseline['entries'] != result['entries']:
+        print(f"  (different corpus: {baseline['entries']} vs {result['entries']} entries)")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['record', 'synth', 'run'])
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--fixtures', help='fixture directory (default: synthetic set for --entries)')
+    parser.add_argument('--save', action='store_true', help=f'write the result to {RESULT_DIR}/')
+    parser.add_argument('--compare', help='earlier result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.fixtures or os.path.join(FIXTURE_DIR, 'recorded'))
+        return
+
+    fixture_dir = args.fixtures or os.path.join(FIXTURE_DIR, f'synth-{args.entries}')
+    if args.command == 'synth' or not os.path.exists(os.path.join(fixture_dir, 'index.json')):
+        synthesize(fixture_dir, args.entries)
+        if args.command == 'synth':
+            return
+
+    result = run(fixture_dir)
+    print_result(result)
+
+    if args.save:
+        os.makedirs(RESULT_DIR, exist_ok=True)
+        path = os.path.join(RESULT_DIR, f"ingest-{result['entries']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Saved {path}")
+
+    if args.compare and compare(result, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Memory benchmark: archive held as dicts vs the columnar ArticleTable.
+
+Scales the collected archive to N articles (unique ids and URLs), then
+measures with tracemalloc:
+  - the list of dicts json.load gives back
+  - the same articles as an ArticleTable
+  - the whole NewsIndex, old layout (dicts + list postings) vs current
+Then forks a few "workers" off the built index, runs queries in each and
+reports how much of their memory stayed shared (Linux only).
+
+    python bench_memory.py [articles] [workers]
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+from article_table import ArticleTable
+from news_index import NewsIndex, ngrams
+from news_store import NewsStore
+
+
+def scaled_archive(archive, count):
+    articles = []
+    copy = 0
+    while len(articles) < count:
+        for a in archive:
+            if len(articles) >= count:
+                break
+            if copy:
+                new_id = f"{a['id']}x{copy}"
+                a = dict(a, id=new_id, url=a['url'].replace(a['id'], new_id))
+            articles.append(a)
+        copy += 1
+    # Round-trip through JSON so strings aren't shared, as after a real load
+    return json.loads(json.dumps(articles, ensure_ascii=False))
+
+
+def legacy_index(articles):
+    # The structures NewsIndex held before ArticleTable
+    articles = sorted(articles, key=lambda a: (a['date'], a['url']))
+    keys = [(a['date'], a['url']) for a in articles]
+    by_municipality, by_source, by_gram = {}, {}, {}
+    for pos, a in enumerate(articles):
+        by_municipality.setdefault(a['municipalityId'], []).append(pos)
+        by_source.setdefault(a['source'], []).append(pos)
+        text = '\n'.join([a['title'], a['content'], a['MunicipalityName']]).lower()
+        for gram in ngrams(text):
+            by_gram.setdefault(gram, []).append(pos)
+    return articles, keys, [k[0] for k in keys], by_municipality, by_source, by_gram
+
+
+def traced(build):
+    """Memory still held by build()'s result, and the peak while building."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held, peak
+
+
+def private_dirty_kb():
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Private_Dirty:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def fork_workers(index, workers):
+    # What gunicorn --preload does: fork after the index is built
+    gc.freeze()
+    municipalities = sorted(index.by_municipality)
+    pids = []
+    for w in range(workers):
+        r, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            before = private_dirty_kb()
+            for i in range(200):
+                index.query(municipalities=[municipalities[i % len(municipalities)]], limit=50)
+            for keyword in ('高校', '観光', '選挙', '台風', '奄美大島'):
+                index.query(keyword=keyword, limit=20)
+            os.write(wfd, json.dumps([before, private_dirty_kb()]).encode())
+            os._exit(0)
+        os.close(wfd)
+        pids.append((pid, r))
+
+    results = []
+    for pid, r in pids:
+        data = os.read(r, 1024)
+        os.close(r)
+        os.waitpid(pid, 0)
+        results.append(json.loads(data))
+    gc.unfreeze()
+    return results
+
+
+def mb(n):
+    return f'{n / 1024 / 1024:8.1f} MB'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    archive = NewsStore('news_data').load()
+    if not archive:
+        print("No articles in news_data, run collect_news.py first.")
+        return
+
+    articles, dicts_held, _ = traced(lambda: scaled_archive(archive, count))
+    table, table_held, table_peak = traced(lambda: ArticleTable(articles))
+    assert all(table.row(i) == a for i, a in enumerate(articles[:2000])), 'rows differ'
+    del table
+
+    legacy, legacy_held, _ = traced(lambda: legacy_index(articles))
+    del legacy
+
+    def build_index():
+        index = NewsIndex(None)
+        index._build(articles)
+        return index
+    index, index_held, index_peak = traced(build_index)
+
+    print(f"Articles: {count}")
+    print(f"  dicts (json.load)     {mb(dicts_held)}  {dicts_held / count:6.0f} B/article")
+    print(f"  ArticleTable          {mb(table_held)}  {table_held / count:6.0f} B/article  (peak while building {mb(table_peak)})")
+    print(f"  index, dicts + lists  {mb(legacy_held + dicts_held)}  (incl. the dicts it keeps)")
+    print(f"  index, table + arrays {mb(index_held)}  (peak while building {mb(index_peak)})")
+
+    del articles
+    gc.collect()
+    if workers and hasattr(os, 'fork') and private_dirty_kb() is not None:
+        print(f"Forked workers ({workers}), private dirty memory before/after 205 queries each:")
+        for i, (before, after) in enumerate(fork_workers(index, workers)):
+            print(f"  worker {i}: {before / 1024:6.1f} MB -> {after / 1024:6.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
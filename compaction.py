@@ -0,0 +1,100 @@
+"""Moves old months of the archive into smaller retention tiers.
+
+    hot   months ending within HOT_DAYS     full records, shards/YYYY-MM.json
+    warm  months ending within WARM_DAYS    slim records (id, url, title, date, source,
+                                            municipality, seq, real imageUrl),
+                                            archive/YYYY-MM.warm.json.gz
+    cold  older                             slim records, one per story: reports that
+                                            story_clusters.py grouped with an earlier
+                                            one are dropped, archive/YYYY-MM.cold.json.gz
+
+HOT_DAYS is longer than the ingest age limit (ingest.MAX_AGE_DAYS), so new
+articles land in hot months. Compaction goes by the manifest: a month
+already in its tier isn't read, so a run only touches months that just
+crossed a boundary, and running it twice changes nothing. Tiers only get
+colder; an article added to a compacted month is stored slim in that
+month's tier (NewsStore.add), without the cold tier's one-per-story pass.
+
+    python compaction.py [--hot-days N] [--warm-days N] [--dry-run]
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from ingest import MAX_AGE_DAYS
+from news_store import COLD, HOT, WARM, NewsStore
+from story_clusters import INDEX_PATH as STORY_INDEX_PATH, StoryIndex, article_key
+
+HOT_DAYS = MAX_AGE_DAYS + 35
+WARM_DAYS = 3 * 365
+
+ORDER = {HOT: 0, WARM: 1, COLD: 2}
+
+
+def month_end(key):
+    year, month = int(key[:4]), int(key[5:7])
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return datetime(year, month, 1)
+
+
+def target_tier(key, now, hot_days=HOT_DAYS, warm_days=WARM_DAYS):
+    end = month_end(key)
+    if end > now - timedelta(days=hot_days):
+        return HOT
+    if end > now - timedelta(days=warm_days):
+        return WARM
+    return COLD
+
+
+def story_representatives(articles, story_index):
+    """Drops articles their story has an earlier report of."""
+    return [a for a in articles if not story_index.is_repeat(article_key(a))]
+
+
+def compact(store, story_index, now=None, hot_days=HOT_DAYS, warm_days=WARM_DAYS, dry_run=False):
+    """Moves months whose tier is out of date. Returns {key: (old tier, new tier, count before, count after)}."""
+    now = now or datetime.now()
+    manifest = store.manifest()
+    moved = {}
+    for key, info in sorted(manifest['shards'].items()):
+        current = info.get('tier', HOT)
+        target = target_tier(key, now, hot_days, warm_days)
+        if ORDER[target] <= ORDER[current]:
+            continue
+        articles = store.load_shard(key, info)
+        if target == COLD:
+            articles = story_representatives(articles, story_index)
+        moved[key] = (current, target, info['count'], len(articles))
+        if dry_run:
+            continue
+        if articles:
+            store.write_archive(key, target, articles, manifest)
+        else:
+            store.remove_month(key, manifest)  # every report had an earlier one elsewhere
+        if target == COLD:
+            story_index.forget_repeats(key)
+
+    if moved and not dry_run:
+        store.save_manifest(manifest)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old archive months into warm / cold tiers.')
+    parser.add_argument('--hot-days', type=int, default=HOT_DAYS)
+    parser.add_argument('--warm-days', type=int, default=WARM_DAYS)
+    parser.add_argument('--dry-run', action='store_true', help='only print what would move')
+    args = parser.parse_args()
+
+    store = NewsStore('news_data')
+    story_index = StoryIndex(STORY_INDEX_PATH)
+    moved = compact(store, story_index, hot_days=args.hot_days,
+                    warm_days=args.warm_days, dry_run=args.dry_run)
+    if moved and not args.dry_run:
+        story_index.save()  # cold months used up their repeats
+    for key, (old, new, before, after) in moved.items():
+        print(f"{key}: {old} -> {new}, {before} -> {after} articles")
+    print(f"{len(moved)} month(s) {'would move' if args.dry_run else 'moved'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import json
+import os
+import time
+
+# How many GUIDs to remember per query. Google News search feeds return
+# up to ~100 entries, so this covers a full feed with some margin.
+MAX_SEEN_GUIDS = 300
+
+
+class FetchState:
+    """Per-feed HTTP validators and recently seen GUIDs, kept between runs.
+
+    Stored as JSON keyed by the feed URL:
+        { url: { places: [...], etag, modified, length, guids: [...], checked } }
+    `places` is the query group the URL was planned for, so the feeds kept
+    here are also the previous query plan.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.feeds = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.feeds = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print(f"Fetch state {path} was unreadable, starting fresh.")
+                self.feeds = {}
+
+    def plan(self):
+        """The query groups last kept by prune(), or None."""
+        groups = [entry['places'] for entry in self.feeds.values() if entry.get('places')]
+        return groups or None
+
+    def prune(self, plan):
+        """Keeps only the feeds of plan ({url: places}), recording their places."""
+        self.feeds = {url: dict(self.feeds.get(url, {}), places=list(places))
+                      for url, places in plan.items()}
+
+    def request_headers(self, url):
+        entry = self.feeds.get(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('modified'):
+            headers['If-Modified-Since'] = entry['modified']
+        return headers
+
+    def last_length(self, url):
+        return self.feeds.get(url, {}).get('length', 0)
+
+    def known_guids(self, url):
+        return set(self.feeds.get(url, {}).get('guids', []))
+
+    def mark_not_modified(self, url):
+        self.feeds.setdefault(url, {})['checked'] = int(time.time())
+
+    def update(self, url, etag, modified, length, guids):
+        entry = self.feeds.setdefault(url, {})
+        entry['etag'] = etag
+        entry['modified'] = modified
+        entry['length'] = length
+        # Newest first, keep the previous ones behind them
+        merged = list(dict.fromkeys(list(guids) + entry.get('guids', [])))
+        entry['guids'] = merged[:MAX_SEEN_GUIDS]
+        entry['checked'] = int(time.time())
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.feeds, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,14 @@
+# gunicorn reads this before importing the app. Patch the standard library
+# first, so the locks, threads and sockets app.py sets up at import (under
+# preload) are already gevent-aware.
+from gevent import monkey
+
+monkey.patch_all()
+
+# Build the index once and fork (shared pages, see app.py)
+preload_app = True
+
+# One greenlet per connection: the /api/news/stream clients idling on an
+# open map don't each hold a thread
+worker_class = 'gevent'
+worker_connections = 1000
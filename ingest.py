@@ -0,0 +1,319 @@
+"""Feed ingest shared by the web app (/api/news) and the collector (collect_news.py).
+
+    run = IngestRun(store, state)      # state: FetchState, or None to fetch unconditionally
+                                       # schedule=PollSchedule: only the queries that are due
+    for article in run.articles():     # fetch -> parse -> filter -> classify, one article at a time
+        ...
+
+feedparser and the HTTP client are imported on first use, so importing this
+module (and app.py with it) stays cheap for gunicorn workers that only serve
+the archive.
+"""
+import os
+import re
+import ssl
+import time
+import urllib.parse
+from collections import Counter
+from datetime import datetime, timedelta
+
+from locations import MUNICIPALITIES, ISLANDS, classify_location
+from metrics import METRICS, StageTimer
+from news_store import title_fingerprint
+from query_planner import RATE_WINDOW_DAYS, build_query, plan_queries, publish_rates
+
+# SSL fix
+if hasattr(ssl, '_create_unverified_context'):
+    ssl._create_default_https_context = ssl._create_unverified_context
+
+# Strict Source List
+ALLOWED_SOURCES = {
+    'amamishimbun.co.jp': '奄美新聞',
+    'nankainn.com': '南海日日新聞',
+    'amami-minamisantou.keizai.biz': '奄美群島南三島経済新聞',
+    'ryukyushimpo.jp': '琉球新報',
+    '373news.com': '南日本新聞'
+}
+
+# Simplified Strict Source List names (must match RSS source.title approx)
+ALLOWED_SOURCE_NAMES = ['奄美新聞', '南海日日新聞', '奄美群島南三島経済新聞', '琉球新報', '琉球新報デジタル', '南日本新聞']
+
+# Overridable so benchmarks can point the pipeline at stub_feed_server.py
+GOOGLE_NEWS_RSS_URL = os.environ.get('GOOGLE_NEWS_RSS_URL', 'https://news.google.com/rss/search')
+
+# Stop walking a feed after this many already-known GUIDs in a row
+KNOWN_STREAK_LIMIT = 5
+
+MAX_AGE_DAYS = 365
+
+IMAGE_SRC = re.compile(r'src="([^"]+)"')
+
+
+def parse_date(struct_time):
+    if struct_time:
+        return datetime.fromtimestamp(time.mktime(struct_time)).isoformat()
+    return datetime.now().isoformat()
+
+
+def age_cutoff(now=None):
+    """Newest publish time that counts as too old, comparable with published_parsed.
+
+    Entries are dropped when they are more than MAX_AGE_DAYS whole days old;
+    computing the bound once lets the loop compare time tuples instead of
+    building a datetime per entry.
+    """
+    now = now or datetime.now()
+    return (now - timedelta(days=MAX_AGE_DAYS + 1)).timetuple()[:6]
+
+
+def is_date_sorted(dates):
+    # Newest first with every date present: everything after the first
+    # too-old entry is too old as well
+    return all(dates) and all(a >= b for a, b in zip(dates, dates[1:]))
+
+
+def get_google_news_rss(places):
+    # One place or an OR-group of places, restricted to the allowed sites
+    full_query = build_query(places, ALLOWED_SOURCES.keys())
+    encoded_query = urllib.parse.quote(full_query)
+    return f"{GOOGLE_NEWS_RSS_URL}?q={encoded_query}&hl=ja&gl=JP&ceid=JP:ja"
+
+
+def source_name(entry):
+    """Publisher name of an entry, mapped onto ALLOWED_SOURCE_NAMES where possible."""
+    name = "Google News"
+    if 'source' in entry and 'title' in entry.source:
+        name = entry.source.title
+
+    # Some feeds give the domain instead of the name
+    if name not in ALLOWED_SOURCE_NAMES:
+        for domain, jp_name in ALLOWED_SOURCES.items():
+            if domain in name:
+                name = jp_name
+                break
+
+    if name == '琉球新報デジタル':
+        name = '琉球新報'
+    return name
+
+
+def parse_feed(content):
+    import feedparser  # only needed once there is something to parse
+    return feedparser.parse(content)
+
+
+def build_article(entry, location, source, date):
+    image_url = f"https://placehold.co/100x70/0099c6/FFF?text={location['name'][:2]}"
+    summary = entry.summary if 'summary' in entry else ""
+    if 'src="' in summary:
+        match = IMAGE_SRC.search(summary)
+        if match:
+            image_url = match.group(1)
+
+    return {
+        'id': entry.guid if 'guid' in entry else entry.link,
+        'municipalityId': location['id'],
+        'MunicipalityName': location['name'],
+        'date': date,
+        'title': entry.title,  # Keep original title for display
+        'content': summary[:100] + '...',
+        'source': source,
+        'imageUrl': image_url,
+        'url': entry.link
+    }
+
+
+def iter_articles(entries, seen_urls, dropped, stages, known_guids=(), cutoff=None):
+    """Yields the articles worth keeping from one feed's entries.
+
+    seen_urls is shared across feeds (an article found by two queries is
+    kept once); reasons for skipping an entry are counted in `dropped`.
+    cutoff comes from age_cutoff(), once per run. On a feed sorted newest
+    first the walk ends at the first entry that is too old, or after
+    KNOWN_STREAK_LIMIT known GUIDs in a row. Feeds in any other order
+    (Google News search ranks by relevance) are walked to the end.
+    """
+    if cutoff is None:
+        cutoff = age_cutoff()
+    dates = [entry.get('published_parsed') for entry in entries]
+    stop_when_old = is_date_sorted(dates)
+
+    known_streak = 0
+    for i, entry in enumerate(entries):
+        # Already handled in an earlier run
+        if known_guids and entry.get('guid', entry.get('link')) in known_guids:
+            dropped['known'] += 1
+            known_streak += 1
+            if stop_when_old and known_streak >= KNOWN_STREAK_LIMIT:
+                break
+            continue
+        known_streak = 0
+
+        url = entry.link
+        if url in seen_urls:
+            dropped['duplicate'] += 1
+            continue
+
+        published = dates[i]
+        if published and published <= cutoff:
+            if stop_when_old:
+                dropped['age'] += len(entries) - i
+                break
+            dropped['age'] += 1
+            continue
+
+        # 1. Filter by Block Keywords + Municipality/Island match (one pass)
+        with stages('classify'):
+            location, blocked = classify_location(entry.title)
+        if blocked:
+            dropped['blocked'] += 1
+            continue
+
+        # 2. Strict Source Check
+        source = source_name(entry)
+        if source not in ALLOWED_SOURCE_NAMES:
+            dropped['source'] += 1
+            continue
+
+        # 3. Municipality/Island Assignment
+        # (municipality first, islands as fallback, see locations.py)
+        if not location:
+            dropped['location'] += 1
+            continue
+
+        seen_urls.add(url)
+        # Same local wall-clock reading as parse_date(), without the round trip
+        date = datetime(*published[:6]).isoformat() if published else parse_date(None)
+        yield build_article(entry, location, source, date)
+
+
+def resolve_articles(articles, resolver):
+    """Points articles at their canonical publisher URL (url_resolver.py) and
+    drops the ones that turn out to be the same story: same canonical URL, or
+    same title fingerprint. The Google News token stays in `id`."""
+    canonical = resolver.resolve([a['url'] for a in articles])
+    seen = set()
+    kept = []
+    for a in articles:
+        url = canonical[a['url']]
+        fingerprint = title_fingerprint(a)
+        if url in seen or fingerprint in seen:
+            METRICS.inc('news_entries_dropped_total', reason='same_story')
+            continue
+        seen.add(url)
+        seen.add(fingerprint)
+        kept.append(dict(a, url=url) if url != a['url'] else a)
+    return kept
+
+
+class IngestRun:
+    """One pass over every planned Google News query.
+
+    With a FetchState, feeds are fetched conditionally (304s are skipped),
+    already-seen GUIDs end the walk through a feed early, and the state is
+    updated in memory; saving it is left to the caller. With a PollSchedule,
+    only the queries it says are due are fetched, and what each one found
+    is recorded in it (poll_schedule.py). Counters for the run report are
+    kept on the instance.
+    """
+
+    def __init__(self, store, state=None, schedule=None):
+        self.store = store
+        self.state = state
+        self.schedule = schedule
+        self.rates = {}
+        self.feeds_skipped = 0
+        self.bytes_saved = 0
+        self.bytes_fetched = 0
+        self.entries_skipped = 0
+        self.search_targets = []
+        self.polled_targets = []
+
+    def plan(self):
+        # Places are packed into a few OR queries sized from recent publish rates
+        # (query_planner.py); places with no history keep a query of their own.
+        locations = MUNICIPALITIES + ISLANDS
+        # The previous plan is kept while rates drift a little, so feed URLs
+        # (and the fetch state keyed by them) stay the same between runs.
+        self.rates = publish_rates(self.store.load_recent(RATE_WINDOW_DAYS), locations)
+        previous = self.state.plan() if self.state else None
+        self.search_targets = plan_queries([loc['name'] for loc in locations], self.rates,
+                                           ALLOWED_SOURCES.keys(), previous=previous)
+        return self.search_targets
+
+    def articles(self):
+        from async_fetch import fetch_feeds  # pulls in httpx; not needed to serve the archive
+
+        # One pooled async client, per-host limits, retries and deadlines (async_fetch.py)
+        targets = self.plan()
+        if self.schedule:
+            targets = self.schedule.due(targets, self.rates)
+        self.polled_targets = targets
+        url_to_group = {get_google_news_rss(q): q for q in targets}
+        url_to_query = {url: ' OR '.join(q) for url, q in url_to_group.items()}
+        headers = None
+        if self.state:
+            headers = {url: self.state.request_headers(url) for url in url_to_query}
+        responses = fetch_feeds(list(url_to_query), headers=headers)
+
+        seen_urls = set()
+        cutoff = age_cutoff()
+        for rss_url, response in responses.items():
+            query = url_to_query[rss_url]
+            METRICS.observe('news_stage_seconds', response.elapsed, stage='fetch', query=query)
+            try:
+                found = Counter()
+                for article in self._feed_articles(rss_url, query, response, seen_urls, cutoff):
+                    found[article['MunicipalityName']] += 1
+                    yield article
+                if self.schedule and not response.error:
+                    self.schedule.record(url_to_group[rss_url], found, self.rates)
+            except Exception as e:
+                METRICS.inc('news_feed_errors_total', stage='process')
+                print(f"Error processing {query}: {e}")
+
+    def _feed_articles(self, rss_url, query, response, seen_urls, cutoff):
+        if response.error:
+            METRICS.inc('news_feed_errors_total', stage='fetch')
+            print(f"Error fetching {query}: {response.error}")
+            return
+
+        if response.status_code == 304 and self.state:
+            METRICS.inc('news_feeds_not_modified_total')
+            self.state.mark_not_modified(rss_url)
+            self.feeds_skipped += 1
+            self.bytes_saved += self.state.last_length(rss_url)
+            return
+
+        self.bytes_fetched += len(response.content)
+        METRICS.inc('news_feed_bytes_total', len(response.content))
+        with METRICS.timer('news_stage_seconds', stage='parse'):
+            feed = parse_feed(response.content)
+        METRICS.inc('news_entries_total', len(feed.entries))
+
+        known_guids = self.state.known_guids(rss_url) if self.state else ()
+
+        dropped = Counter()
+        stages = StageTimer()
+        loop_start = time.perf_counter()
+        # Time spent by the consumer between articles lands in 'filter' too;
+        # both callers only append to a list.
+        yield from iter_articles(feed.entries, seen_urls, dropped, stages, known_guids, cutoff)
+
+        # Everything in the entry loop that isn't classification is filtering
+        stages.totals['filter'] = time.perf_counter() - loop_start - stages.totals.get('classify', 0.0)
+        stages.flush(METRICS)
+        self.entries_skipped += dropped['known']
+        for reason, count in dropped.items():
+            METRICS.inc('news_entries_dropped_total', count, reason=reason)
+
+        # Validators and GUIDs only once every entry went through: a feed
+        # that failed halfway is fetched and walked in full next time
+        if self.state:
+            self.state.update(
+                rss_url,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified'),
+                len(response.content),
+                [e.get('guid', e.get('link')) for e in feed.entries],
+            )
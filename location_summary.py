@@ -0,0 +1,117 @@
+"""Per-location aggregates the map can draw before any shard is downloaded.
+
+    {
+      generated: YYYY-MM-DD, the last day `days` covers,
+      locations: { municipalityId: entry },   articles tagged with that id
+      islands:   { islandId: entry },         the island's own articles plus its municipalities'
+    }
+    entry = { total, days: {YYYY-MM-DD: n}, weeks: {monday YYYY-MM-DD: n},
+              months: {YYYY-MM: n}, sources: {source: n},
+              latest: [{ municipalityId, date, title, source, url }] }   newest first
+
+Days cover the last DAYS days and weeks the last WEEKS weeks; months and
+sources cover the whole archive. Published by static_publish.publish_store
+as dist/summary.<hash>.json.
+
+    python location_summary.py
+"""
+from datetime import datetime, timedelta
+
+from locations import ISLANDS, MUNICIPALITIES
+
+DAYS = 31
+WEEKS = 26
+LATEST = 5
+
+# No 'id': Google News ids repeat the URL token and would double the file
+LATEST_FIELDS = ('municipalityId', 'date', 'title', 'source', 'url')
+
+# municipality / small island id -> the island it's on (matches index.html LOCATIONS)
+ISLAND_OF = {loc['id']: loc['island'] for loc in MUNICIPALITIES + ISLANDS if 'island' in loc}
+# Islands that are their own area (奄美大島, 徳之島...), as in the location filter
+AREA_IDS = {loc['id'] for loc in ISLANDS if 'island' not in loc}
+
+
+def week_start(day):
+    """Monday of the week a YYYY-MM-DD date falls in."""
+    d = datetime.strptime(day, '%Y-%m-%d')
+    return (d - timedelta(days=d.weekday())).strftime('%Y-%m-%d')
+
+
+class _Entry:
+    __slots__ = ('total', 'days', 'weeks', 'months', 'sources', 'latest')
+
+    def __init__(self):
+        self.total = 0
+        self.days = {}
+        self.weeks = {}
+        self.months = {}
+        self.sources = {}
+        self.latest = []
+
+    def add(self, article, day, week, day_from, week_from, latest):
+        self.total += 1
+        if day >= day_from:
+            self.days[day] = self.days.get(day, 0) + 1
+        if week >= week_from:
+            self.weeks[week] = self.weeks.get(week, 0) + 1
+        month = day[:7]
+        self.months[month] = self.months.get(month, 0) + 1
+        self.sources[article['source']] = self.sources.get(article['source'], 0) + 1
+        if len(self.latest) < latest:
+            self.latest.append({field: article[field] for field in LATEST_FIELDS})
+
+    def published(self):
+        return {
+            'total': self.total,
+            'days': dict(sorted(self.days.items())),
+            'weeks': dict(sorted(self.weeks.items())),
+            'months': dict(sorted(self.months.items())),
+            'sources': dict(sorted(self.sources.items(), key=lambda kv: -kv[1])),
+            'latest': self.latest,
+        }
+
+
+def build_summary(articles, now=None, latest=LATEST):
+    """One pass over the archive; articles may come in any order."""
+    now = now or datetime.now()
+    day_from = (now - timedelta(days=DAYS - 1)).strftime('%Y-%m-%d')
+    week_from = week_start((now - timedelta(weeks=WEEKS - 1)).strftime('%Y-%m-%d'))
+
+    locations = {}
+    islands = {}
+    weeks = {}  # day -> week, a few hundred distinct days at most
+    for a in sorted(articles, key=lambda a: a['date'], reverse=True):
+        day = a['date'][:10]
+        week = weeks.get(day)
+        if week is None:
+            week = weeks[day] = week_start(day)
+        loc_id = a['municipalityId']
+        targets = [locations.setdefault(loc_id, _Entry())]
+        island = ISLAND_OF.get(loc_id, loc_id if loc_id in AREA_IDS else None)
+        if island:
+            targets.append(islands.setdefault(island, _Entry()))
+        for entry in targets:
+            entry.add(a, day, week, day_from, week_from, latest)
+
+    return {
+        'generated': now.strftime('%Y-%m-%d'),  # day precision: same data, same file
+        'locations': {k: v.published() for k, v in sorted(locations.items())},
+        'islands': {k: v.published() for k, v in sorted(islands.items())},
+    }
+
+
+def main():
+    from news_store import NewsStore
+    from static_publish import minify_json
+
+    summary = build_summary(NewsStore('news_data').load())
+    for loc_id, entry in summary['locations'].items():
+        recent = sum(entry['days'].values())
+        print(f"{loc_id:15} {entry['total']:6} total  {recent:4} in {DAYS} days  "
+              f"{len(entry['sources'])} sources")
+    print(f"{len(minify_json(summary)) / 1024:.1f} KB minified")
+
+
+if __name__ == '__main__':
+    main()
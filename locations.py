@@ -0,0 +1,161 @@
+import re
+from collections import deque
+
+MUNICIPALITIES = [
+    { 'id': 'amami', 'name': '奄美市', 'keywords': ['奄美市'], 'island': 'amami_oshima' },
+    { 'id': 'yamato', 'name': '大和村', 'keywords': ['大和村'], 'island': 'amami_oshima' },
+    { 'id': 'uken', 'name': '宇検村', 'keywords': ['宇検村'], 'island': 'amami_oshima' },
+    { 'id': 'setouchi', 'name': '瀬戸内町', 'keywords': ['瀬戸内町'], 'island': 'amami_oshima' },
+    { 'id': 'tatsugo', 'name': '龍郷町', 'keywords': ['龍郷町'], 'island': 'amami_oshima' },
+    { 'id': 'kikai', 'name': '喜界町', 'keywords': ['喜界町'], 'island': 'kikai_jima' },
+    { 'id': 'tokunoshima', 'name': '徳之島町', 'keywords': ['徳之島町'], 'island': 'tokuno_shima' },
+    { 'id': 'amagi', 'name': '天城町', 'keywords': ['天城町'], 'island': 'tokuno_shima' },
+    { 'id': 'isen', 'name': '伊仙町', 'keywords': ['伊仙町'], 'island': 'tokuno_shima' },
+    { 'id': 'wadomari', 'name': '和泊町', 'keywords': ['和泊町'], 'island': 'okino_erabu' },
+    { 'id': 'china', 'name': '知名町', 'keywords': ['知名町', '知名'], 'island': 'okino_erabu' }, # Allow "China" without "cho"
+    { 'id': 'yoron', 'name': '与論町', 'keywords': ['与論町', '与論'], 'island': 'yoron_jima' }
+]
+
+# Island Definitions (Fallback)
+ISLANDS = [
+    { 'id': 'kikai_jima', 'name': '喜界島', 'keywords': ['喜界島'] },
+    { 'id': 'tokuno_shima', 'name': '徳之島', 'keywords': ['徳之島'] },
+    { 'id': 'okino_erabu', 'name': '沖永良部島', 'keywords': ['沖永良部', '沖永良部島'] },
+    { 'id': 'yoron_jima', 'name': '与論島', 'keywords': ['与論島'] },
+    { 'id': 'kakeroma_jima', 'name': '加計呂麻島', 'keywords': ['加計呂麻島', '加計呂麻'], 'island': 'amami_oshima' },
+    { 'id': 'uke_jima', 'name': '請島', 'keywords': ['請島'], 'island': 'amami_oshima' },
+    { 'id': 'yoro_shima', 'name': '与路島', 'keywords': ['与路島'], 'island': 'amami_oshima' },
+    # Amami Oshima / Generic Amami (Fallback - Lowest Priority)
+    { 'id': 'amami_oshima', 'name': '奄美大島', 'keywords': ['奄美大島', '奄美', '奄美群島'] }
+]
+
+# Keywords to exclude based on Title
+BLOCK_KEYWORDS = ['tag', 'list', 'category', 'archive', 'writer', 'photo', 'pr', 'ad', 'タグ', '一覧', 'まとめ', 'アーカイブ', '特集', '求人', '人事']
+
+# Text ignored for location matching. The newspaper name contains "奄美"
+# and would otherwise tag every one of its articles as Amami.
+IGNORED_PHRASES = ['奄美群島南三島経済新聞']
+
+# Pattern kinds stored in the automaton outputs
+LOCATION = 0
+BLOCK = 1
+IGNORE = 2
+
+
+class LocationClassifier:
+    """Aho-Corasick automaton over every location, block and ignore keyword.
+
+    One left-to-right pass over a title finds all (possibly overlapping)
+    keyword hits. Priority rules:
+      1. Any block keyword -> blocked.
+      2. Location hits inside an ignored phrase don't count.
+      3. Municipalities win over islands; within a group the list order wins,
+         so the generic 奄美 entry (last island) is the lowest fallback.
+    """
+
+    def __init__(self, municipalities, islands, block_keywords=(), ignored_phrases=()):
+        self.locations = list(municipalities) + list(islands)
+
+        patterns = []
+        for rank, loc in enumerate(self.locations):
+            for kw in loc['keywords']:
+                patterns.append((kw, LOCATION, rank))
+        for kw in block_keywords:
+            patterns.append((kw, BLOCK, 0))
+        for kw in ignored_phrases:
+            patterns.append((kw, IGNORE, 0))
+
+        self._compile(patterns)
+
+    def _compile(self, patterns):
+        # Trie
+        goto = [{}]
+        outputs = [[]]
+        for word, kind, rank in patterns:
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append((kind, rank, len(word)))
+
+        # Failure links (BFS), then fold them into a full transition table so
+        # matching is a single dict lookup per character.
+        fail = [0] * len(goto)
+        delta = [dict(g) for g in goto]
+        queue = deque()
+        for ch, s in goto[0].items():
+            queue.append(s)
+        while queue:
+            state = queue.popleft()
+            f = fail[state]
+            outputs[state] = outputs[state] + outputs[f]
+            # Inherit the failure state's transitions for chars we don't have
+            for ch, s in delta[f].items():
+                if ch not in goto[state]:
+                    delta[state][ch] = s
+            for ch, s in goto[state].items():
+                fail[s] = delta[f].get(ch, 0)
+                queue.append(s)
+
+        self._delta = delta
+        self._outputs = [tuple(o) for o in outputs]
+
+        # Characters that appear in no keyword always send the automaton back
+        # to the root, so only runs of keyword characters need to be walked.
+        alphabet = sorted({ch for word, _, _ in patterns for ch in word})
+        min_length = min((len(word) for word, _, _ in patterns), default=1)
+        self._runs = re.compile('[%s]{%d,}' % (''.join(re.escape(ch) for ch in alphabet), min_length))
+
+    def classify(self, title):
+        """Returns (location dict or None, blocked)."""
+        delta = self._delta
+        outputs = self._outputs
+        hits = []
+        ignored = []
+        blocked = False
+
+        for run in self._runs.finditer(title):
+            state = 0
+            end = run.start()
+            for ch in run.group():
+                end += 1
+                state = delta[state].get(ch, 0)
+                out = outputs[state]
+                if out:
+                    for kind, rank, length in out:
+                        if kind == LOCATION:
+                            hits.append((rank, end - length, end))
+                        elif kind == BLOCK:
+                            blocked = True
+                        else:
+                            ignored.append((end - length, end))
+
+        if not hits:
+            return None, blocked
+        if ignored:
+            hits = [h for h in hits
+                    if not any(s <= h[1] and h[2] <= e for s, e in ignored)]
+            if not hits:
+                return None, blocked
+        return self.locations[min(hits)[0]], blocked
+
+    def classify_batch(self, titles):
+        classify = self.classify
+        return [classify(t) for t in titles]
+
+
+# Compiled once at import, shared by the collector and the web app
+CLASSIFIER = LocationClassifier(MUNICIPALITIES, ISLANDS, BLOCK_KEYWORDS, IGNORED_PHRASES)
+
+
+def classify_location(title):
+    return CLASSIFIER.classify(title)
+
+
+def classify_locations(titles):
+    return CLASSIFIER.classify_batch(titles)
@@ -0,0 +1,144 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds. Covers a sub-millisecond classify pass up to a slow feed fetch.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    'news_stage_seconds': 'Time spent per pipeline stage',
+    'news_entries_total': 'Feed entries seen',
+    'news_entries_dropped_total': 'Feed entries discarded, by reason',
+    'news_articles_total': 'Articles kept after filtering',
+    'news_feed_errors_total': 'Feeds that failed to fetch or parse',
+    'news_feed_bytes_total': 'Feed bytes downloaded',
+    'news_feeds_not_modified_total': 'Feeds answered with 304',
+}
+
+
+class Metrics:
+    """In-process counters and histograms, rendered in Prometheus text format.
+
+    Labels are passed as keyword arguments:
+        METRICS.inc('news_entries_dropped_total', reason='age')
+        with METRICS.timer('news_stage_seconds', stage='parse'): ...
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+
+        lines = []
+        for name in sorted({k[0] for k in counters}):
+            _header(lines, name, 'counter')
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        for name in sorted({k[0] for k in histograms}):
+            _header(lines, name, 'histogram')
+            for (n, labels), hist in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for bound, count in zip(self.buckets, hist):
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {hist[-1]}')
+                lines.append(f'{name}_sum{_labels(labels)} {hist[-2]:.6f}')
+                lines.append(f'{name}_count{_labels(labels)} {hist[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Plain dict for JSON reports: counters and per-histogram count/sum."""
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            timings = [
+                {'name': name, 'labels': dict(labels), 'count': hist[-1], 'seconds': round(hist[-2], 6)}
+                for (name, labels), hist in sorted(self._histograms.items())
+            ]
+        return {'counters': counters, 'timings': timings}
+
+
+class StageTimer:
+    """Adds up time per stage inside a hot loop, then reports once.
+
+    Cheaper than a histogram sample per entry:
+        stages = StageTimer()
+        with stages('classify'): ...
+        stages.flush(METRICS, query=...)
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._stage = None
+        self._start = 0.0
+
+    def __call__(self, stage):
+        self._stage = stage
+        return self
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.totals[self._stage] = self.totals.get(self._stage, 0.0) + time.perf_counter() - self._start
+        return False
+
+    def flush(self, metrics, **labels):
+        for stage, seconds in self.totals.items():
+            metrics.observe('news_stage_seconds', seconds, stage=stage, **labels)
+        self.totals = {}
+
+
+def _header(lines, name, kind):
+    if name in HELP:
+        lines.append(f'# HELP {name} {HELP[name]}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+# Process-wide registry (one per gunicorn worker / collector run)
+METRICS = Metrics()
@@ -0,0 +1,98 @@
+import threading
+import time
+
+
+class SnapshotCache:
+    """Keeps the last result of an expensive loader in memory.
+
+    - Fresh (age < ttl): served as is.
+    - Stale (ttl <= age < ttl + stale_ttl): served as is, refresh kicked off in background.
+    - Expired / empty: caller waits for a refresh.
+    Only one refresh runs at a time (single-flight), concurrent misses wait for it.
+    """
+
+    def __init__(self, loader, ttl=600, stale_ttl=3600, refresh_interval=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_interval = refresh_interval
+
+        self._value = None
+        self._updated_at = None
+        self._last_error = None
+        self._lock = threading.Lock()          # protects the fields above
+        self._refresh_lock = threading.Lock()  # single-flight refresh
+        self._scheduler = None
+
+    def age(self):
+        if self._updated_at is None:
+            return None
+        return time.time() - self._updated_at
+
+    def refresh(self):
+        """Run the loader unless another thread is already doing it.
+        Returns True if this call did the refresh."""
+        if not self._refresh_lock.acquire(blocking=False):
+            # Someone else is refreshing, wait for them and reuse their result
+            with self._refresh_lock:
+                return False
+        try:
+            try:
+                value = self.loader()
+            except Exception as e:
+                print(f"Snapshot refresh failed: {e}")
+                with self._lock:
+                    self._last_error = str(e)
+                return False
+            with self._lock:
+                self._value = value
+                self._updated_at = time.time()
+                self._last_error = None
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh_in_background(self):
+        if self._refresh_lock.locked():
+            return
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def get(self):
+        """Returns (value, status). status is one of fresh / stale / miss."""
+        self.start_scheduler()
+
+        age = self.age()
+        if age is not None and age < self.ttl:
+            return self._value, 'fresh'
+
+        if age is not None and age < self.ttl + self.stale_ttl:
+            self._refresh_in_background()
+            return self._value, 'stale'
+
+        self.refresh()
+        return self._value, 'miss'
+
+    def health(self):
+        age = self.age()
+        return {
+            'age': None if age is None else round(age, 1),
+            'ttl': self.ttl,
+            'refreshing': self._refresh_lock.locked(),
+            'lastError': self._last_error,
+        }
+
+    def start_scheduler(self):
+        # Started lazily from the first request so each gunicorn worker gets
+        # its own thread after fork.
+        if not self.refresh_interval or self._scheduler is not None:
+            return
+        with self._lock:
+            if self._scheduler is not None:
+                return
+            self._scheduler = threading.Thread(target=self._run_scheduler, daemon=True)
+            self._scheduler.start()
+
+    def _run_scheduler(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh()
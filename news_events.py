@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# How often each worker checks the manifest for collector output
+POLL_SECONDS = 5
+# Articles kept for reconnecting clients; older cursors are told to resync
+REPLAY_ARTICLES = 1000
+# Comment line sent on quiet connections so proxies don't drop them
+HEARTBEAT_SECONDS = 25
+# Streams end after this long; EventSource reconnects with Last-Event-ID
+STREAM_SECONDS = 30 * 60
+RETRY_MS = 10000
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+class ArticleEvents:
+    """Pushes newly stored articles to open Server-Sent Events streams.
+
+    One watcher thread per worker polls the store manifest's mtime; when the
+    collector has written, it loads the articles after the last known `seq`
+    (the same cursor as /api/news/since) into a bounded replay buffer and
+    wakes the streams. A stream only waits on a Condition, so under the
+    gevent worker (gunicorn.conf.py) an idle client costs a greenlet, not a
+    thread.
+
+    on_change, if given, is called from the watcher whenever the manifest
+    changed, before the new articles are pushed.
+
+    Event ids are seqs. A client reconnecting with an id the buffer still
+    covers gets what it missed; an older one gets a `reset` event and
+    catches up through /api/news/since.
+
+    In production the collector runs in GitHub Actions and every run
+    redeploys the app, so no running worker ever sees the manifest change.
+    That's why the watcher first fills the buffer with the last `replay`
+    articles already stored: a page open across the redeploy reconnects
+    to the new worker and gets the articles it missed pushed to it.
+    """
+
+    def __init__(self, store, poll_seconds=POLL_SECONDS, replay=REPLAY_ARTICLES, on_change=None):
+        self.store = store
+        self.on_change = on_change
+        self.poll_seconds = poll_seconds
+        self._buffer = deque(maxlen=replay)   # articles, oldest seq first
+        self._floor = None                    # the buffer holds everything after this seq
+        self._seq = None
+        self._mtime = None
+        self._changed = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._watcher = None
+        self.clients = 0
+
+    def start(self):
+        # Started lazily from the first stream so each gunicorn worker gets
+        # its own watcher after fork.
+        if self._watcher is not None:
+            return
+        with self._changed:
+            if self._watcher is not None:
+                return
+            self._seq = self._floor = self.store.manifest().get('seq', 0)
+            # Left unset, so the first poll runs on_change: the manifest may
+            # have changed between loading the app and starting this worker
+            self._mtime = None
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+    def _manifest_mtime(self):
+        try:
+            return os.path.getmtime(self.store.manifest_path)
+        except OSError:
+            return None
+
+    def _watch(self):
+        self.preload()
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Article event poll failed: {e}")
+
+    def preload(self):
+        """Fills the buffer with the newest articles stored before start().
+        Until then it covers nothing older, and reconnecting clients get `reset`."""
+        with self._poll_lock:
+            top = self._floor  # a poll may have buffered newer ones already
+            room = self._buffer.maxlen - len(self._buffer)
+            floor = max(0, top - room)
+            recent = [a for a in self.store.load_since(floor) if a['seq'] <= top]
+            if len(recent) > room:
+                recent = recent[-room:] if room else []
+                floor = recent[0]['seq'] - 1 if recent else top
+            with self._changed:
+                self._buffer.extendleft(reversed(recent))
+                self._floor = floor
+                self._changed.notify_all()
+            return len(recent)
+
+    def poll(self):
+        """Loads articles added since the last poll. Returns how many."""
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self):
+        mtime = self._manifest_mtime()
+        if mtime == self._mtime:
+            return 0
+        self._mtime = mtime
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception as e:
+                print(f"Manifest change handler failed: {e}")
+        seq = self.store.manifest().get('seq', 0)
+        if seq < self._seq:
+            # A different archive (reset / restore): nobody's cursor means anything now
+            with self._changed:
+                self._buffer.clear()
+                self._seq = self._floor = seq
+                self._changed.notify_all()
+            return 0
+        if seq == self._seq:
+            return 0
+
+        fresh = self.store.load_since(self._seq)
+        with self._changed:
+            for article in fresh:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._floor = self._buffer[0]['seq']
+                self._buffer.append(article)
+            self._seq = seq
+            self._changed.notify_all()
+        return len(fresh)
+
+    def since(self, cursor):
+        """(articles after cursor, latest seq), or None if the buffer no longer covers cursor."""
+        with self._changed:
+            if cursor < self._floor or cursor > self._seq:
+                return None
+            return [a for a in self._buffer if a['seq'] > cursor], self._seq
+
+    def stream(self, cursor, heartbeat=HEARTBEAT_SECONDS, duration=STREAM_SECONDS):
+        """Generator of SSE text for one client, starting after `cursor`."""
+        self.start()
+        self.clients += 1
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            deadline = time.monotonic() + duration
+            if cursor > self._seq:
+                self.poll()  # the client saw a newer manifest than the watcher has yet
+            while time.monotonic() < deadline:
+                result = self.since(cursor)
+                if result is None:
+                    yield format_event('reset', {'cursor': self._seq})
+                    return
+                articles, latest = result
+                if articles:
+                    yield format_event('articles', articles, event_id=latest)
+                    cursor = latest
+                with self._changed:
+                    if self._seq == cursor:
+                        woke = self._changed.wait(timeout=heartbeat)
+                    else:
+                        woke = True
+                if not woke:
+                    yield ': ping\n\n'
+        finally:
+            self.clients -= 1
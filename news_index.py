@@ -0,0 +1,265 @@
+import base64
+import bisect
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+from article_table import ArticleTable, date_key
+from news_store import HOT, cooperative
+
+# Compacted months (compaction.py) kept decoded per worker, most recently used
+ARCHIVE_CACHE_MONTHS = 6
+
+# Character n-gram size for the text index. Bigrams work for Japanese
+# without a morphological analyzer.
+NGRAM = 2
+
+
+def ngrams(text, n=NGRAM):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def encode_cursor(key):
+    raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        date, url = json.loads(raw.decode('utf-8'))
+        if not isinstance(date, str) or not isinstance(url, str):
+            raise ValueError
+        return (date, url)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+class NewsIndex:
+    """Read-only indexes over the article archive, rebuilt when the
+    NewsStore manifest changes (reload_if_changed, from app.py's manifest
+    watcher, not from requests).
+
+    Articles are kept sorted by (date, url) ascending in a columnar
+    ArticleTable, so a row number doubles as a date order. Every posting
+    list is a sorted array of row numbers, which means a date range is just
+    a row range. Built before gunicorn forks (--preload), all of it is a
+    handful of large buffers the workers share copy-on-write.
+
+    Only hot months are indexed. Compacted months are read when a query
+    runs past the indexed rows, one month at a time, newest first.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._archive = []   # (key, manifest entry) of compacted months, newest first
+        self._archive_cache = OrderedDict()
+        self._build([])
+
+    def _build(self, articles):
+        articles = sorted(articles, key=lambda a: (a['date'], a['url']))
+        by_municipality = {}
+        by_source = {}
+        by_gram = {}
+
+        for pos, a in enumerate(cooperative(articles)):
+            by_municipality.setdefault(a['municipalityId'], []).append(pos)
+            by_source.setdefault(a['source'], []).append(pos)
+            text = self._search_text(a['title'], a['content'], a['MunicipalityName'])
+            for gram in ngrams(text):
+                by_gram.setdefault(gram, []).append(pos)
+
+        # Swap everything at once so readers never see a half-built index
+        self.articles = ArticleTable(articles)
+        self.by_municipality = _compact(by_municipality)
+        self.by_source = _compact(by_source)
+        self.by_gram = _compact(by_gram)
+
+    @staticmethod
+    def _search_text(title, content, municipality_name):
+        # Same fields the frontend keyword filter looks at
+        return '\n'.join([title, content, municipality_name]).lower()
+
+    def _row_text(self, pos):
+        table = self.articles
+        return self._search_text(table.titles[pos], table.content(pos), table.municipality_names[pos])
+
+    def reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.store.manifest_path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            try:
+                shards = self.store.manifest()['shards']
+                articles = self.store.load(tiers=(HOT,))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Could not load {self.store.base_dir}: {e}")
+                return False
+            self._build(articles)
+            self._archive = [(key, info) for key, info in sorted(shards.items(), reverse=True)
+                             if info.get('tier', HOT) != HOT]
+            self._archive_cache = OrderedDict()
+            self._mtime = mtime
+            print(f"Indexed {len(self.articles)} articles from {self.store.base_dir}")
+            return True
+
+    def _text_candidates(self, keyword, lo, hi):
+        keyword = keyword.lower()
+        grams = ngrams(keyword)
+        if grams:
+            postings = []
+            for gram in grams:
+                plist = self.by_gram.get(gram)
+                if not plist:
+                    return []
+                postings.append(plist)
+            # Start from the rarest gram and narrow it down
+            postings.sort(key=len)
+            candidates = _slice(postings[0], lo, hi)
+            for plist in postings[1:]:
+                allowed = set(_slice(plist, lo, hi))
+                candidates = [p for p in candidates if p in allowed]
+        else:
+            candidates = range(lo, hi)
+        # Grams only say "maybe", confirm the actual substring
+        return [p for p in candidates if keyword in self._row_text(p)]
+
+    def query(self, municipalities=None, sources=None, start=None, end=None,
+              keyword=None, limit=50, cursor=None):
+        """Returns (articles newest first, next cursor or None).
+
+        start / end are ISO date(time) strings, compared the same way the
+        stored `date` strings sort. end is inclusive of the whole day when
+        only a date is given.
+        """
+        table = self.articles
+        lo = 0 if not start else bisect.bisect_left(table.dates, _date_arg(start))
+        if end:
+            if len(end) == 10:
+                end = end + 'T23:59:59.999999'
+            hi = bisect.bisect_right(table.dates, _date_arg(end))
+        else:
+            hi = len(table)
+        before = decode_cursor(cursor) if cursor else None
+        if before:
+            hi = min(hi, table.position(*before))
+        if lo >= hi:
+            positions = []
+        else:
+            positions = self._positions(municipalities, sources, keyword, lo, hi)
+
+        # Newest first: walk positions from the end
+        page = [table.row(p) for p in reversed(positions[-limit:])] if limit > 0 else []
+        more = len(positions) > limit
+        if not more and limit > 0 and self._archive:
+            # The index ran out: carry on into the compacted months
+            wanted = limit - len(page) + 1
+            older = self._archive_rows(municipalities, sources, keyword, start, end, before, wanted)
+            more = len(older) == wanted
+            page.extend(older[:limit - len(page)])
+
+        next_cursor = None
+        if more and page:
+            last = page[-1]
+            next_cursor = encode_cursor((last['date'], last['url']))
+        return page, next_cursor
+
+    def _positions(self, municipalities, sources, keyword, lo, hi):
+        filters = []
+        if municipalities:
+            filters.append(_union(self.by_municipality, municipalities, lo, hi))
+        if sources:
+            filters.append(_union(self.by_source, sources, lo, hi))
+        if keyword and keyword.strip():
+            filters.append(self._text_candidates(keyword.strip(), lo, hi))
+
+        if filters:
+            filters.sort(key=len)
+            positions = filters[0]
+            for other in filters[1:]:
+                allowed = set(other)
+                positions = [p for p in positions if p in allowed]
+        else:
+            positions = range(lo, hi)
+        return positions
+
+    def get(self, date, url):
+        """The stored article with this date and url, or None."""
+        table = self.articles
+        pos = table.position(date, url)
+        if pos < len(table) and table.url(pos) == url:
+            return table.row(pos)
+        for key, info in self._archive:
+            if info['first'] <= date <= info['last']:
+                return next((a for a in self._archive_month(key, info) if a['url'] == url), None)
+        return None
+
+    def _archive_rows(self, municipalities, sources, keyword, start, end, before, wanted):
+        """Up to `wanted` matching articles from compacted months, newest first."""
+        keyword = keyword.strip().lower() if keyword and keyword.strip() else None
+        found = []
+        for key, info in self._archive:
+            if start and info['last'] < start:
+                break  # this month and every older one end before the range
+            if (end and info['first'] > end) or (before and info['first'] > before[0]):
+                continue
+            for a in self._archive_month(key, info):
+                if (start and a['date'] < start) or (end and a['date'] > end):
+                    continue
+                if before and (a['date'], a['url']) >= before:
+                    continue
+                if municipalities and a['municipalityId'] not in municipalities:
+                    continue
+                if sources and a['source'] not in sources:
+                    continue
+                if keyword and keyword not in self._search_text(a['title'], a['content'], a['MunicipalityName']):
+                    continue
+                found.append(a)
+                if len(found) == wanted:
+                    return found
+        return found
+
+    def _archive_month(self, key, info):
+        articles = self._archive_cache.get(key)
+        if articles is None:
+            articles = self.store.load_shard(key, info)
+            articles.sort(key=lambda a: (a['date'], a['url']), reverse=True)
+            self._archive_cache[key] = articles
+            while len(self._archive_cache) > ARCHIVE_CACHE_MONTHS:
+                self._archive_cache.popitem(last=False)
+        else:
+            self._archive_cache.move_to_end(key)
+        return articles
+
+
+def _date_arg(value):
+    try:
+        return date_key(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid date: {value}')
+
+
+def _compact(index):
+    # Machine-int arrays: ~4 bytes per posting instead of a pointer to an int object
+    return {key: array('I', plist) for key, plist in index.items()}
+
+
+def _slice(plist, lo, hi):
+    return plist[bisect.bisect_left(plist, lo):bisect.bisect_left(plist, hi)]
+
+
+def _union(index, values, lo, hi):
+    merged = []
+    for value in values:
+        merged.extend(_slice(index.get(value, []), lo, hi))
+    return sorted(set(merged))
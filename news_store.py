@@ -0,0 +1,298 @@
+import gzip
+import json
+import os
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta
+
+from article_table import PLACEHOLDER_IMAGE, PLACEHOLDER_PREFIX, link_summary
+from locations import ISLANDS, MUNICIPALITIES
+
+MANIFEST_NAME = 'manifest.json'
+SHARD_DIR_NAME = 'shards'
+ARCHIVE_DIR_NAME = 'archive'
+LEGACY_NAME = 'news.json'
+
+# Retention tiers (compaction.py). Hot months are plain JSON shards with
+# full records; warm and cold months are gzipped slim records. A slim
+# record keeps imageUrl only when it's a real picture, not a placeholder.
+HOT = 'hot'
+WARM = 'warm'
+COLD = 'cold'
+SLIM_FIELDS = ('id', 'url', 'title', 'date', 'source', 'municipalityId', 'seq')
+LOCATION_NAMES = {loc['id']: loc['name'] for loc in MUNICIPALITIES + ISLANDS}
+
+# Long loops of the web app's index rebuilds pause after this many items
+YIELD_EVERY = 500
+
+# ' - 南海日日新聞' / ' - nankainn.com' that Google News appends to titles
+TITLE_SOURCE_SUFFIX = re.compile(r'\s+-\s+\S+$')
+NON_WORD = re.compile(r'[\W_]+')
+
+
+def title_fingerprint(article):
+    """Same paper, same day, same headline (ignoring width, case and
+    punctuation): the same story, whichever link it came with."""
+    title = unicodedata.normalize('NFKC', article['title']).lower()
+    title = NON_WORD.sub('', TITLE_SOURCE_SUFFIX.sub('', title))
+    return f"{article['source']}|{article['date'][:10]}|{title}"
+
+
+def cooperative(items, every=YIELD_EVERY):
+    """Iterates items, sleeping 0 s after every `every` of them. Under the
+    gevent worker (gunicorn.conf.py) that lets the other greenlets run, so
+    a rebuild in the background doesn't stall the requests."""
+    for i, item in enumerate(items, start=1):
+        yield item
+        if i % every == 0:
+            time.sleep(0)
+
+
+def shard_key(article):
+    # 'YYYY-MM' of the article date; an article never moves between shards
+    return article['date'][:7]
+
+
+def slim(article):
+    record = {k: article[k] for k in SLIM_FIELDS if k in article}
+    image = article.get('imageUrl')
+    if image and not image.startswith(PLACEHOLDER_PREFIX):
+        record['imageUrl'] = image
+    return record
+
+
+def expand(record):
+    """A slim record in the shape of a stored article. The summary, and the
+    image if there was none, become what the collector writes for a
+    link-only Google News entry."""
+    name = LOCATION_NAMES.get(record['municipalityId'], record['municipalityId'])
+    article = {
+        'id': record.get('id', record['url']),
+        'municipalityId': record['municipalityId'],
+        'MunicipalityName': name,
+        'date': record['date'],
+        'title': record['title'],
+        'content': link_summary(record['url']),
+        'source': record['source'],
+        'imageUrl': record.get('imageUrl') or PLACEHOLDER_IMAGE.format(name[:2]),
+        'url': record['url'],
+    }
+    if 'seq' in record:
+        article['seq'] = record['seq']
+    return article
+
+
+class NewsStore:
+    """Article archive split into one JSON file per month.
+
+    news_data/
+        manifest.json        { shards: { 'YYYY-MM': {file, count, first, last, maxSeq, tier?} }, total, seq, updated }
+        shards/YYYY-MM.json  articles of that month, newest first
+        archive/YYYY-MM.<tier>.json.gz   compacted months (compaction.py), slim records
+
+    Adding articles only reads and rewrites the months they belong to.
+    Every added article gets `seq`, a run-independent, increasing ingest
+    number (articles stored before sequencing count as 0), so clients can
+    ask for "everything after seq N".
+
+    Compacted months load as full articles again (expand), but only when
+    asked for: `tiers` limits a load to e.g. the hot months.
+    """
+
+    def __init__(self, base_dir='news_data'):
+        self.base_dir = base_dir
+        self.shard_dir = os.path.join(base_dir, SHARD_DIR_NAME)
+        self.manifest_path = os.path.join(base_dir, MANIFEST_NAME)
+        self.legacy_path = os.path.join(base_dir, LEGACY_NAME)
+
+    def manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'shards': {}, 'total': 0, 'seq': 0, 'updated': None}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def shard_path(self, key):
+        return os.path.join(self.shard_dir, f'{key}.json')
+
+    def archive_path(self, key, tier):
+        return os.path.join(self.base_dir, ARCHIVE_DIR_NAME, f'{key}.{tier}.json.gz')
+
+    def load_shard(self, key, info=None):
+        if info is None:
+            info = self.manifest()['shards'].get(key, {})
+        records = self.load_records(key, info)
+        if info.get('tier', HOT) != HOT:
+            return [expand(r) for r in records]
+        return records
+
+    def load_records(self, key, info=None):
+        """A month as stored: full articles when hot, slim records otherwise."""
+        if info is None:
+            info = self.manifest()['shards'].get(key, {})
+        tier = info.get('tier', HOT)
+        if tier != HOT:
+            path = self.archive_path(key, tier)
+            if not os.path.exists(path):
+                return []
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        path = self.shard_path(key)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def shard_keys(self, since=None, tiers=None):
+        """Shard keys newest first. since: ISO date string, keeps the months that can contain it or later.
+        tiers: only months in these tiers."""
+        shards = self.manifest()['shards']
+        keys = sorted(shards.keys(), reverse=True)
+        if since:
+            keys = [k for k in keys if k >= since[:7]]
+        if tiers is not None:
+            keys = [k for k in keys if shards[k].get('tier', HOT) in tiers]
+        return keys
+
+    def load(self, since=None, tiers=None):
+        """Articles newest first, optionally only those dated on/after `since`
+        and only from months in `tiers`."""
+        shards = self.manifest()['shards']
+        articles = []
+        for key in self.shard_keys(since, tiers):
+            articles.extend(self.load_shard(key, shards[key]))
+        if since:
+            articles = [a for a in articles if a['date'] >= since]
+        return articles
+
+    def load_recent(self, days=30):
+        since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        return self.load(since)
+
+    def load_since(self, seq, limit=None):
+        """Articles ingested after `seq`, oldest ingest first."""
+        articles = []
+        for key, info in self.manifest()['shards'].items():
+            if info.get('maxSeq', 0) > seq:
+                articles.extend(a for a in self.load_shard(key, info) if a.get('seq', 0) > seq)
+        articles.sort(key=lambda a: a['seq'])
+        return articles[:limit] if limit else articles
+
+    def add(self, new_articles):
+        """Merges articles into their month shards, skipping URLs and title
+        fingerprints already stored. Returns the number of articles actually added."""
+        by_shard = {}
+        for a in new_articles:
+            by_shard.setdefault(shard_key(a), []).append(a)
+        if not by_shard:
+            return 0
+
+        manifest = self.manifest()
+        seq = manifest.get('seq', 0)
+        added = 0
+        for key, items in by_shard.items():
+            info = manifest['shards'].get(key, {})
+            shard = self.load_records(key, info)
+            known = {a['url'] for a in shard}
+            known_titles = {title_fingerprint(a) for a in shard}
+            fresh = []
+            for a in items:
+                fingerprint = title_fingerprint(a)
+                if a['url'] not in known and fingerprint not in known_titles:
+                    known.add(a['url'])
+                    known_titles.add(fingerprint)
+                    seq += 1
+                    fresh.append(dict(a, seq=seq))
+            if not fresh:
+                continue
+            added += len(fresh)
+            tier = info.get('tier', HOT)
+            if tier == HOT:
+                shard.extend(fresh)
+                self._write_shard(key, shard, manifest)
+            else:
+                # A compacted month stays in its tier; the new articles join it slim
+                shard.extend(slim(a) for a in fresh)
+                self.write_archive(key, tier, shard, manifest)
+
+        if added:
+            manifest['seq'] = seq
+            self.save_manifest(manifest)
+        return added
+
+    def migrate_legacy(self):
+        """Splits a single news.json into month shards (one-time). Returns True if it ran."""
+        if not os.path.exists(self.legacy_path) or os.path.exists(self.manifest_path):
+            return False
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            articles = json.load(f)
+        print(f"Migrating {len(articles)} articles from {self.legacy_path} to monthly shards...")
+        self.add(articles)
+        os.remove(self.legacy_path)
+        return True
+
+    def write_archive(self, key, tier, shard, manifest):
+        """Stores a month as slim records in the given tier, replacing its previous file.
+        The caller writes the manifest."""
+        os.makedirs(os.path.join(self.base_dir, ARCHIVE_DIR_NAME), exist_ok=True)
+        shard.sort(key=lambda x: x['date'], reverse=True)
+        data = json.dumps([slim(a) for a in shard], ensure_ascii=False, separators=(',', ':'))
+        write_bytes(self.archive_path(key, tier), gzip.compress(data.encode('utf-8'), compresslevel=9, mtime=0))
+        self._remove_month_files(key, manifest, keep=self.archive_path(key, tier))
+        manifest['shards'][key] = {
+            'file': f'{ARCHIVE_DIR_NAME}/{key}.{tier}.json.gz',
+            'count': len(shard),
+            'first': shard[-1]['date'],
+            'last': shard[0]['date'],
+            'maxSeq': max(a.get('seq', 0) for a in shard),
+            'tier': tier,
+        }
+
+    def remove_month(self, key, manifest):
+        """Deletes a month altogether. The caller writes the manifest."""
+        self._remove_month_files(key, manifest, keep=None)
+        manifest['shards'].pop(key, None)
+
+    def _remove_month_files(self, key, manifest, keep):
+        info = manifest['shards'].get(key)
+        if not info:
+            return
+        path = os.path.join(self.base_dir, info['file'])
+        if path != keep and os.path.exists(path):
+            os.remove(path)
+
+    def _write_shard(self, key, shard, manifest):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        shard.sort(key=lambda x: x['date'], reverse=True)
+        _write_json(self.shard_path(key), shard, indent=2)
+        self._remove_month_files(key, manifest, keep=self.shard_path(key))
+        manifest['shards'][key] = {
+            'file': f'{SHARD_DIR_NAME}/{key}.json',
+            'count': len(shard),
+            'first': shard[-1]['date'],
+            'last': shard[0]['date'],
+            'maxSeq': max(a.get('seq', 0) for a in shard),
+        }
+
+    def save_manifest(self, manifest):
+        manifest['shards'] = dict(sorted(manifest['shards'].items(), reverse=True))
+        manifest['total'] = sum(s['count'] for s in manifest['shards'].values())
+        manifest['updated'] = datetime.now().isoformat(timespec='seconds')
+        _write_json(self.manifest_path, manifest, indent=2)
+
+
+def _write_json(path, data, indent=None):
+    # Write to a temp file first so readers (the web app) never see half a file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+def write_bytes(path, data):
+    """Replaces path with data in one step, like _write_json. The temp file
+    is per process, so two writers never share one."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
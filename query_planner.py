@@ -0,0 +1,166 @@
+"""Groups place names into a few combined OR queries.
+
+Every Google News search repeats the same five site: clauses and returns at
+most ~100 items, and most place queries overlap with 奄美大島 anyway. The
+planner packs places into groups whose expected volume stays well under the
+result cap, using publish rates from the archive:
+
+    expected(group) = sum(rate_per_day(place)) * HORIZON_DAYS <= RESULT_CAP * FILL_RATIO
+
+so a group can miss a few polls and still return everything new. Busy places
+end up alone, quiet ones share a query.
+
+Feed state (fetch_state.py) is keyed by URL, so the plan has to hold still:
+names are sorted inside and across groups, and the previous plan is kept
+until its groups overflow the budget by REPLAN_MARGIN, or until a plan at
+that margin under the budget would still need fewer queries.
+
+    python query_planner.py            # show the plan from the archive
+    python query_planner.py --measure  # fetch both plans live and compare
+"""
+import sys
+import urllib.parse
+from datetime import datetime, timedelta
+
+RESULT_CAP = 100          # items Google News returns per search feed
+FILL_RATIO = 0.5          # keep groups at half the cap
+HORIZON_DAYS = 7          # a group must hold this many days of news
+RATE_WINDOW_DAYS = 90     # history used to estimate publish rates
+MAX_PLACES_PER_QUERY = 6
+MAX_QUERY_LENGTH = 1500   # encoded q= parameter, well under URL limits
+REPLAN_MARGIN = 0.2       # rate drift the previous plan tolerates either way
+
+
+def build_query(places, sites):
+    """'"a" AND (site:x OR ...)' for one place, '("a" OR "b") AND (...)' for several."""
+    if isinstance(places, str):
+        places = [places]
+    site_query = ' OR '.join([f'site:{domain}' for domain in sites])
+    place_query = ' OR '.join([f'"{p}"' for p in places])
+    if len(places) > 1:
+        place_query = f'({place_query})'
+    return f'{place_query} AND ({site_query})'
+
+
+def publish_rates(articles, locations, days=RATE_WINDOW_DAYS, now=None):
+    """Articles per day for each location name over the last `days`."""
+    now = now or datetime.now()
+    since = (now - timedelta(days=days)).isoformat()
+    names = {loc['id']: loc['name'] for loc in locations}
+    counts = {loc['name']: 0 for loc in locations}
+    for a in articles:
+        if a['date'] >= since and a['municipalityId'] in names:
+            counts[names[a['municipalityId']]] += 1
+    return {name: count / days for name, count in counts.items()}
+
+
+def plan_queries(names, rates=None, sites=(), result_cap=RESULT_CAP, fill_ratio=FILL_RATIO,
+                 horizon_days=HORIZON_DAYS, max_places=MAX_PLACES_PER_QUERY,
+                 max_length=MAX_QUERY_LENGTH, previous=None, margin=REPLAN_MARGIN):
+    """Returns a sorted list of sorted place-name groups (lists), one per query.
+
+    Without rates (no history yet) every place keeps its own query.
+    `previous` is the last plan; it is returned unchanged while the rates
+    stay within `margin` of what it was sized for.
+    """
+    names = sorted(set(names))
+    if not rates or not any(rates.values()):
+        return [[n] for n in names]
+
+    budget = result_cap * fill_ratio
+    expected = {n: rates.get(n, 0) * horizon_days for n in names}
+    if previous:
+        previous = sorted(sorted(g) for g in previous)
+        if (sorted(n for g in previous for n in g) == names
+                and all(sum(expected[n] for n in g) <= budget * (1 + margin) for g in previous)
+                and len(previous) <= len(_pack(names, expected, budget * (1 - margin),
+                                               sites, max_places, max_length))):
+            return previous
+    return _pack(names, expected, budget, sites, max_places, max_length)
+
+
+def _pack(names, expected, budget, sites, max_places, max_length):
+    groups = []  # [names, expected volume]
+
+    # First-fit decreasing: busiest places are placed first
+    for name in sorted(names, key=lambda n: (-expected[n], n)):
+        for group in groups:
+            candidate = group[0] + [name]
+            if (group[1] + expected[name] <= budget
+                    and len(candidate) <= max_places
+                    and len(urllib.parse.quote(build_query(candidate, sites))) <= max_length):
+                group[0].append(name)
+                group[1] += expected[name]
+                break
+        else:
+            groups.append([[name], expected[name]])
+
+    return sorted(sorted(g[0]) for g in groups)
+
+
+def measure_coverage(names, groups, url_for, classify=None):
+    """Fetches the per-place baseline and the grouped plan, compares what they return.
+
+    url_for(places) -> feed URL. classify(title) -> (location, blocked) limits
+    the comparison to entries the collector would actually keep.
+    Returns a dict with request counts, unique links and recall.
+    """
+    import feedparser
+    from async_fetch import fetch_feeds
+
+    def links(query_sets):
+        urls = [url_for(q) for q in query_sets]
+        results = fetch_feeds(urls)
+        found = set()
+        failed = 0
+        for url in urls:
+            result = results[url]
+            if not result.ok:
+                failed += 1
+                continue
+            for entry in feedparser.parse(result.content).entries:
+                if classify:
+                    location, blocked = classify(entry.title)
+                    if blocked or not location:
+                        continue
+                found.add(entry.link)
+        return found, failed
+
+    baseline, baseline_failed = links([[n] for n in names])
+    planned, planned_failed = links(groups)
+    both = baseline & planned
+    return {
+        'baselineRequests': len(names),
+        'plannedRequests': len(groups),
+        'baselineFailed': baseline_failed,
+        'plannedFailed': planned_failed,
+        'baselineLinks': len(baseline),
+        'plannedLinks': len(planned),
+        'onlyPlanned': len(planned - baseline),
+        'recall': round(len(both) / len(baseline), 3) if baseline else None,
+    }
+
+
+def main():
+    from ingest import ALLOWED_SOURCES, get_google_news_rss
+    from locations import MUNICIPALITIES, ISLANDS, classify_location
+    from news_store import NewsStore
+
+    locations = MUNICIPALITIES + ISLANDS
+    names = [loc['name'] for loc in locations]
+    rates = publish_rates(NewsStore('news_data').load_recent(RATE_WINDOW_DAYS), locations)
+    groups = plan_queries(names, rates, ALLOWED_SOURCES.keys())
+
+    print(f"{len(names)} places -> {len(groups)} queries")
+    for group in groups:
+        volume = sum(rates.get(n, 0) for n in group) * HORIZON_DAYS
+        print(f"  ~{volume:5.1f} items/{HORIZON_DAYS}d  {' OR '.join(group)}")
+
+    if '--measure' in sys.argv:
+        report = measure_coverage(names, groups, get_google_news_rss, classify_location)
+        for key, value in report.items():
+            print(f"{key:>18}: {value}")
+
+
+if __name__ == '__main__':
+    main()
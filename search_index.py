@@ -0,0 +1,380 @@
+"""Ranked full-text search over titles and summaries, kept in a file the
+web app memory-maps.
+
+Text is NFKC-normalised, lowercased, stripped of markup and links (most
+Google News summaries are just a link) and cut into character bigrams,
+which works for Japanese without a morphological analyzer. A query
+matches the articles containing all of its bigrams, ranked by BM25.
+
+    news_data/search/<seq>-<docs>.idx
+        b'NSIX' | u32 header length | JSON header | sections, 8-byte aligned:
+        doc_dates  int64[docs]    date_key of each article
+        doc_lens   uint32[docs]   bigrams per article
+        doc_munis  uint16[docs]   code into header['municipalities']
+        doc_sources uint16[docs]  code into header['sources']
+        url_offsets uint64[docs + 1], urls        UTF-8, joined
+        term_offsets uint64[terms + 1], terms     sorted UTF-8 bigrams, joined
+        post_offsets uint64[terms + 1]            each term's slice of:
+        post_docs  uint32[postings]  post_tfs uint16[postings]
+
+Doc ids follow ingest order, so an update only tokenizes the articles
+stored since the file's seq and appends them to each posting list. Every
+update writes a new file (a file mapped on Windows can't be replaced);
+readers open the newest and older ones are removed when nobody holds them.
+
+    python search_index.py [query]
+"""
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from array import array
+
+from article_table import date_key
+from news_store import NON_WORD, TITLE_SOURCE_SUFFIX, cooperative
+
+SEARCH_DIR = os.path.join('news_data', 'search')
+MAGIC = b'NSIX'
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+MARKUP = re.compile(r'<[^>]*>?|https?://\S+|&\w+;')
+
+SECTIONS = [
+    ('doc_dates', 'q'), ('doc_lens', 'I'), ('doc_munis', 'H'), ('doc_sources', 'H'),
+    ('url_offsets', 'Q'), ('urls', 'B'), ('term_offsets', 'Q'), ('terms', 'B'),
+    ('post_offsets', 'Q'), ('post_docs', 'I'), ('post_tfs', 'H'),
+]
+
+
+def tokens(text):
+    """Character bigrams of the word runs in text, with repeats."""
+    text = MARKUP.sub(' ', unicodedata.normalize('NFKC', text).lower())
+    grams = []
+    for run in NON_WORD.split(text):
+        grams.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def article_tokens(article):
+    title = TITLE_SOURCE_SUFFIX.sub('', article['title'])
+    return tokens(title + '\n' + article['content'])
+
+
+class SearchIndex:
+    """Read side of the newest index file in `directory`, plus update()."""
+
+    def __init__(self, directory=SEARCH_DIR):
+        self.directory = directory
+        self.path = None
+        self.header = {'seq': 0, 'docs': 0, 'totalLength': 0, 'municipalities': [], 'sources': []}
+        self._map = None
+        self._views = {}
+        self._manifest_mtime = None
+        self.open()
+
+    # --- reading ---
+
+    def newest_file(self):
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith('.idx')]
+        except OSError:
+            return None
+        return os.path.join(self.directory, max(names, key=_file_order)) if names else None
+
+    def open(self):
+        """(Re)maps the newest file. Returns True if it changed."""
+        path = self.newest_file()
+        if path is None or path == self.path:
+            return False
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:4] != MAGIC:
+            mapped.close()
+            raise ValueError(f'{path} is not a search index')
+        header_len = struct.unpack_from('<I', mapped, 4)[0]
+        header = json.loads(mapped[8:8 + header_len])
+        views = {}
+        whole = memoryview(mapped)
+        for name, code in SECTIONS:
+            start, length = header['sections'][name]
+            views[name] = whole[start:start + length].cast(code)
+
+        # The previous map is unmapped once nothing (e.g. a running search) uses its views
+        self.path, self.header, self._map, self._views = path, header, mapped, views
+        return True
+
+    def __len__(self):
+        return self.header['docs']
+
+    @property
+    def seq(self):
+        return self.header['seq']
+
+    def url(self, doc):
+        offsets = self._views['url_offsets']
+        return bytes(self._views['urls'][offsets[doc]:offsets[doc + 1]]).decode('utf-8')
+
+    def _term_slot(self, term):
+        offsets = self._views['term_offsets']
+        terms = self._views['terms']
+        encoded = term.encode('utf-8')
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(terms[offsets[mid]:offsets[mid + 1]]) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and bytes(terms[offsets[lo]:offsets[lo + 1]]) == encoded:
+            return lo
+        return None
+
+    def postings(self, term):
+        """(doc ids, term frequencies) as memoryviews into the file."""
+        slot = self._term_slot(term)
+        if slot is None:
+            return None
+        offsets = self._views['post_offsets']
+        start, end = offsets[slot], offsets[slot + 1]
+        return self._views['post_docs'][start:end], self._views['post_tfs'][start:end]
+
+    def search(self, query, municipalities=None, sources=None, start=None, end=None, limit=50):
+        """[(score, date_key, url)] best first. Articles must contain every bigram of the query.
+
+        start / end: ISO date(time) strings; end covers the whole day when only a date is given.
+        """
+        terms = sorted(set(tokens(query)))
+        if not terms or not len(self):
+            return []
+        lists = []
+        for term in terms:
+            found = self.postings(term)
+            if found is None:
+                return []
+            lists.append(found)
+        lists.sort(key=lambda p: len(p[0]))
+
+        allowed = None
+        if municipalities or sources:
+            muni_codes = _codes(self.header['municipalities'], municipalities)
+            source_codes = _codes(self.header['sources'], sources)
+            doc_munis, doc_sources = self._views['doc_munis'], self._views['doc_sources']
+            allowed = lambda d: ((muni_codes is None or doc_munis[d] in muni_codes)
+                                 and (source_codes is None or doc_sources[d] in source_codes))
+        lo = date_key(start) if start else None
+        if end and len(end) == 10:
+            end = end + 'T23:59:59.999999'
+        hi = date_key(end) if end else None
+        dates = self._views['doc_dates']
+
+        # Rarest term first: it bounds the candidates
+        docs, tfs = lists[0]
+        candidates = {}
+        for d, tf in zip(docs, tfs):
+            if lo is not None and dates[d] < lo or hi is not None and dates[d] > hi:
+                continue
+            if allowed is not None and not allowed(d):
+                continue
+            candidates[d] = [tf]
+        for docs, tfs in lists[1:]:
+            if not candidates:
+                return []
+            kept = {}
+            for d, tf in zip(docs, tfs):
+                entry = candidates.get(d)
+                if entry is not None:
+                    entry.append(tf)
+                    kept[d] = entry
+            candidates = kept
+
+        n = len(self)
+        avg_len = self.header['totalLength'] / n
+        idfs = [math.log(1 + (n - len(p[0]) + 0.5) / (len(p[0]) + 0.5)) for p in lists]
+        lens = self._views['doc_lens']
+        scored = []
+        for d, term_tfs in candidates.items():
+            norm = K1 * (1 - B + B * lens[d] / avg_len)
+            score = sum(idf * tf * (K1 + 1) / (tf + norm) for idf, tf in zip(idfs, term_tfs))
+            scored.append((score, dates[d], d))
+        scored.sort(reverse=True)
+        return [(round(score, 4), date, self.url(d)) for score, date, d in scored[:limit]]
+
+    def refresh(self, store):
+        """Catches up with the store after the collector wrote: maps a newer
+        file if another process made one, otherwise adds the new articles."""
+        try:
+            mtime = os.path.getmtime(store.manifest_path)
+        except OSError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+        self._manifest_mtime = mtime
+        self.open()
+        return self.update(store) > 0
+
+    # --- writing ---
+
+    def update(self, store):
+        """Adds the articles stored since this file's seq and writes a new file.
+        Returns the number added (0: nothing written)."""
+        manifest_seq = store.manifest().get('seq', 0)
+        if not len(self):
+            articles = store.load()  # first build, including articles stored before seq existed
+            articles.sort(key=lambda a: (a.get('seq', 0), a['date'], a['url']))
+        elif manifest_seq > self.seq:
+            articles = store.load_since(self.seq)
+        else:
+            return 0
+        if not articles and len(self):
+            return 0
+
+        header = dict(self.header, municipalities=list(self.header['municipalities']),
+                      sources=list(self.header['sources']))
+        muni_code = {v: i for i, v in enumerate(header['municipalities'])}
+        source_code = {v: i for i, v in enumerate(header['sources'])}
+        columns = {name: array(code, self._views[name]) if self._views else array(code)
+                   for name, code in SECTIONS[:4]}
+        urls = [self.url(d) for d in cooperative(range(len(self)))]
+
+        new_postings = {}
+        first = len(self)
+        for doc, a in enumerate(cooperative(articles), start=first):
+            grams = article_tokens(a)
+            counts = {}
+            for g in grams:
+                counts[g] = counts.get(g, 0) + 1
+            for g, tf in counts.items():
+                new_postings.setdefault(g, ([], []))
+                new_postings[g][0].append(doc)
+                new_postings[g][1].append(min(tf, 0xFFFF))
+            columns['doc_dates'].append(date_key(a['date']))
+            columns['doc_lens'].append(len(grams))
+            columns['doc_munis'].append(_code(muni_code, header['municipalities'], a['municipalityId']))
+            columns['doc_sources'].append(_code(source_code, header['sources'], a['source']))
+            urls.append(a['url'])
+            header['totalLength'] += len(grams)
+
+        old_terms = self._all_terms()
+        terms = sorted(set(old_terms) | set(new_postings))
+        post_offsets = array('Q', [0])
+        post_docs = array('I')
+        post_tfs = array('H')
+        for term in cooperative(terms):
+            if term in old_terms:
+                docs, tfs = self.postings(term)
+                post_docs.extend(docs)
+                post_tfs.extend(tfs)
+            if term in new_postings:
+                post_docs.extend(new_postings[term][0])
+                post_tfs.extend(new_postings[term][1])
+            post_offsets.append(len(post_docs))
+
+        header['docs'] = len(urls)
+        header['seq'] = max(manifest_seq, max((a.get('seq', 0) for a in articles), default=0))
+        url_offsets, url_blob = _pack_strings(urls)
+        term_offsets, term_blob = _pack_strings(terms)
+        columns.update(url_offsets=url_offsets, urls=url_blob, term_offsets=term_offsets,
+                       terms=term_blob, post_offsets=post_offsets, post_docs=post_docs, post_tfs=post_tfs)
+        self._write(header, columns)
+        self.open()
+        self.remove_old_files()
+        return len(articles)
+
+    def _all_terms(self):
+        if not self._views:
+            return {}
+        offsets = self._views['term_offsets']
+        terms = bytes(self._views['terms'])
+        return {terms[offsets[i]:offsets[i + 1]].decode('utf-8'): i for i in cooperative(range(len(offsets) - 1))}
+
+    def _write(self, header, columns):
+        os.makedirs(self.directory, exist_ok=True)
+        header.pop('sections', None)
+        # Section offsets depend on the header length, which depends on the offsets:
+        # reserve room for them first
+        layout = {name: [0, 0] for name, _ in SECTIONS}
+        header['sections'] = layout
+        raw = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        pos = _align(8 + len(raw) + 20 * len(SECTIONS))
+        for name, _ in SECTIONS:
+            nbytes = len(columns[name]) * columns[name].itemsize
+            layout[name] = [pos, nbytes]
+            pos = _align(pos + nbytes)
+        raw = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        header_end = 8 + len(raw)
+        assert header_end <= layout[SECTIONS[0][0]][0]
+
+        name = f"{header['seq']:012d}-{header['docs']:09d}.idx"
+        path = os.path.join(self.directory, name)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(raw)) + raw)
+            for section, _ in SECTIONS:
+                f.seek(layout[section][0])
+                columns[section].tofile(f)
+        os.replace(tmp_path, path)
+
+    def remove_old_files(self):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path != self.path and name.endswith('.idx'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # still mapped by a process on Windows; next update tries again
+
+
+def _file_order(name):
+    seq, docs = name[:-len('.idx')].split('-')
+    return int(seq), int(docs)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _code(lookup, values, value):
+    code = lookup.get(value)
+    if code is None:
+        code = lookup[value] = len(values)
+        values.append(value)
+    return code
+
+
+def _codes(values, wanted):
+    if not wanted:
+        return None
+    return {i for i, v in enumerate(values) if v in set(wanted)}
+
+
+def _pack_strings(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = array('Q', [0])
+    total = 0
+    for e in encoded:
+        total += len(e)
+        offsets.append(total)
+    return offsets, array('B', b''.join(encoded))
+
+
+def main():
+    from news_store import NewsStore
+
+    index = SearchIndex()
+    added = index.update(NewsStore('news_data'))
+    print(f"Added {added} articles, {len(index)} indexed in {index.path} "
+          f"({os.path.getsize(index.path) / 1024:.0f} KB)")
+    if len(sys.argv) > 1:
+        for score, _, url in index.search(' '.join(sys.argv[1:]), limit=10):
+            print(f"{score:7.3f}  {url}")
+
+
+if __name__ == '__main__':
+    main()
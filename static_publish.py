@@ -0,0 +1,137 @@
+"""Minified, content-hashed copies of the archive for the web app (news_data/dist).
+
+dist/ is built, not committed: the collector writes the minified .json
+files, and the deploy build (render.yaml) runs `python static_publish.py`,
+which adds the .gz / .br variants. Compressed files don't delta in git,
+and Brotli at quality 11 is the slowest part of a collector run. When a
+variant is missing, app.py compresses the file on first request and
+keeps it in memory.
+
+    python static_publish.py      # publish with .gz / .br variants
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from news_store import write_bytes
+
+try:
+    import brotli
+except ImportError:  # optional, gzip alone still works
+    brotli = None
+
+DIST_DIR_NAME = 'dist'
+
+# Encodings in order of preference, with their file suffixes
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def minify_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def write_variants(path, data, compressed=True):
+    """Writes path plus, if compressed, its .gz / .br siblings; files that
+    are there already (same name, same content) are left alone.
+    Returns whether the main file was new."""
+    new = not os.path.exists(path)
+    if new:
+        write_bytes(path, data)
+    for encoding, suffix in (ENCODINGS if compressed else ()):
+        if os.path.exists(path + suffix) and not new:
+            continue
+        variant = compress(data, encoding)
+        if variant is not None:
+            write_bytes(path + suffix, variant)
+    return new
+
+
+def publish_store(store, stories=None, summary=None, compressed=False):
+    """Publishes the store's shards as minified, content-hashed files,
+    with precompressed siblings if `compressed`.
+
+    news_data/dist/
+        manifest.json(.gz/.br)            same shape as the store manifest, files point here
+        YYYY-MM.<hash>.json(.gz/.br)      immutable, safe to cache forever; warm / cold
+                                          months stay slim records (news_store.slim)
+        stories.<hash>.json(.gz/.br)      story clusters (story_clusters.py), if given;
+                                          the manifest's `stories` points at it
+        summary.<hash>.json(.gz/.br)      per-location counts and latest articles
+                                          (location_summary.py), manifest `summary`
+
+    Unchanged shards keep their file; files no longer referenced are removed.
+    Returns the number of shard files written.
+    """
+    dist_dir = os.path.join(store.base_dir, DIST_DIR_NAME)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    manifest = store.manifest()
+    published = dict(manifest, shards={})
+    keep = set()
+    written = 0
+
+    for key, info in manifest['shards'].items():
+        data = minify_json(store.load_records(key, info))
+        name = f'{key}.{content_hash(data)}.json'
+        keep.add(name)
+        if write_variants(os.path.join(dist_dir, name), data, compressed):
+            written += 1
+        published['shards'][key] = dict(info, file=f'{DIST_DIR_NAME}/{name}')
+
+    # Side artifacts, listed in the manifest under their own key
+    for key, value in (('stories', stories), ('summary', summary)):
+        if value is None:
+            continue
+        data = minify_json(value)
+        name = f'{key}.{content_hash(data)}.json'
+        keep.add(name)
+        write_variants(os.path.join(dist_dir, name), data, compressed)
+        published[key] = f'{DIST_DIR_NAME}/{name}'
+
+    # The manifest isn't hashed: drop the old one with its variants
+    manifest_path = os.path.join(dist_dir, 'manifest.json')
+    for suffix in [''] + [suffix for _, suffix in ENCODINGS]:
+        if os.path.exists(manifest_path + suffix):
+            os.remove(manifest_path + suffix)
+    write_variants(manifest_path, minify_json(published), compressed)
+    keep.add('manifest.json')
+
+    # Drop shard versions nothing points at any more
+    for filename in os.listdir(dist_dir):
+        base = filename
+        for _, suffix in ENCODINGS:
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        if base not in keep:
+            os.remove(os.path.join(dist_dir, filename))
+
+    return written
+
+
+def main():
+    from location_summary import build_summary
+    from news_store import NewsStore
+    from story_clusters import INDEX_PATH, StoryIndex
+
+    store = NewsStore('news_data')
+    stories = StoryIndex(INDEX_PATH).published(store)
+    written = publish_store(store, stories, build_summary(store.load()), compressed=True)
+    print(f"Published {written} new shard file(s) to news_data/dist, with .gz / .br variants")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""Groups reports of the same event from different papers into stories.
+
+Titles are shingled into character n-grams (the ' - source' suffix, section
+breadcrumbs and punctuation removed), summarised as MinHash signatures and bucketed by LSH
+bands, so each new article is only compared with the few archived ones that
+share a band, never with the whole archive. Candidates must also agree on
+enough signature positions and be published within WINDOW_DAYS of each
+other, and mention the same numbers. Two reports from the same paper must
+also carry the same publish time: a paper re-lists a report under a second
+URL at the same minute, while its recurring notices ('奄美大島近海で震度１の
+地震', several a day) differ only in time.
+
+The index is incremental: it remembers the store seq it has seen and only
+hashes articles added since. Signatures and stories older than KEEP_DAYS
+are dropped; the later reports of a dropped story are remembered in
+`repeats` until cold compaction has used them.
+
+    news_data/stories.json   { format, seq, signatures: { key: [time, sig, numbers, source] },
+                               stories: { id: { key: date } }, repeats: { key: date } }
+    python story_clusters.py [--rebuild]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+from news_store import NON_WORD, TITLE_SOURCE_SUFFIX
+
+SHINGLE = 3
+PERMUTATIONS = 32
+BANDS = 8                      # 8 bands x 4 rows: pairs above ~0.6 similarity almost always meet
+ROWS = PERMUTATIONS // BANDS
+VALUE_HEX = 4                  # 16 bits kept per minimum (b-bit MinHash)
+THRESHOLD = 0.6                # fraction of equal signature positions to count as the same story
+WINDOW_DAYS = 3
+KEEP_DAYS = 120                # signatures older than this can't meet new articles any more
+FORMAT = 2                     # stories.json layout; an index in another one is rebuilt
+
+INDEX_PATH = os.path.join('news_data', 'stories.json')
+
+NUMBER = re.compile(r'\d+')
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # fixed: signatures are persisted
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(PERMUTATIONS)]
+
+
+def article_key(article):
+    return hashlib.blake2b(article['url'].encode('utf-8'), digest_size=8).hexdigest()
+
+
+def first_report(members):
+    """Key of a story's representative: its report from the earliest day
+    (the index keeps days), ties broken by key. The same rule decides the
+    published representative, what cold compaction keeps and which report
+    index.html shows."""
+    return min(members, key=lambda k: (members[k], k))
+
+
+def clean_title(title):
+    title = unicodedata.normalize('NFKC', title).lower()
+    # Section breadcrumbs ('... | 地震情報 | くらし') repeat across unrelated stories
+    return TITLE_SOURCE_SUFFIX.sub('', title).split('|')[0]
+
+
+def numbers(title):
+    # '震度4' and '震度2' on the same day are two earthquakes
+    return ','.join(sorted(set(NUMBER.findall(clean_title(title)))))
+
+
+def shingles(title):
+    title = NON_WORD.sub('', clean_title(title))
+    if len(title) <= SHINGLE:
+        return {title} if title else set()
+    return {title[i:i + SHINGLE] for i in range(len(title) - SHINGLE + 1)}
+
+
+def signature(title):
+    """MinHash signature as a hex string, VALUE_HEX characters per permutation."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+              for s in shingles(title)]
+    if not hashes:
+        return None
+    mask = (1 << (VALUE_HEX * 4)) - 1
+    return ''.join(format(min((a * h + b) % _PRIME for h in hashes) & mask, f'0{VALUE_HEX}x')
+                   for a, b in _PERMS)
+
+
+def band_keys(sig):
+    width = ROWS * VALUE_HEX
+    return [f'{i}:{sig[i * width:(i + 1) * width]}' for i in range(BANDS)]
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    same = sum(a[i:i + VALUE_HEX] == b[i:i + VALUE_HEX] for i in range(0, len(a), VALUE_HEX))
+    return same / PERMUTATIONS
+
+
+class StoryIndex:
+    """Persisted MinHash/LSH index plus the stories (clusters) found so far."""
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.seq = 0
+        self.signatures = {}   # key -> [time, sig, numbers, source], time to the minute
+        self.stories = {}      # story id -> {key: date}
+        self.repeats = {}      # key -> date, later reports of stories already dropped
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('format') != FORMAT:
+                    raise KeyError('format')
+                self.seq = data['seq']
+                self.signatures = data['signatures']
+                self.stories = data['stories']
+                self.repeats = data['repeats']
+            except (OSError, KeyError, json.JSONDecodeError):
+                print(f"Story index {path} was unreadable or outdated, rebuilding.")
+                self.seq = 0
+                self.signatures = {}
+                self.stories = {}
+                self.repeats = {}
+
+        self.story_of = {key: sid for sid, members in self.stories.items() for key in members}
+        self._index_buckets()
+
+    def _index_buckets(self):
+        self.buckets = {}
+        for key, (_, sig, _, _) in self.signatures.items():
+            for band in band_keys(sig):
+                self.buckets.setdefault(band, []).append(key)
+
+    def update(self, store):
+        """Hashes the articles added to the store since the last update.
+        Returns the number of articles hashed."""
+        manifest_seq = store.manifest().get('seq', 0)
+        if not self.signatures and not self.seq:
+            articles = store.load()  # first run, including articles stored before seq existed
+        else:
+            articles = store.load_since(self.seq)
+        articles.sort(key=lambda a: a['date'])
+
+        hashed = 0
+        for a in articles:
+            if self.add(a):
+                hashed += 1
+        self.seq = max(self.seq, manifest_seq)
+        return hashed
+
+    def add(self, article):
+        key = article_key(article)
+        if key in self.signatures:
+            return False
+        sig = signature(article['title'])
+        if sig is None:
+            return False
+        time = article['date'][:16]
+        nums = numbers(article['title'])
+        source = article['source']
+
+        matches = set()
+        for band in band_keys(sig):
+            for other in self.buckets.get(band, ()):
+                if other in matches:
+                    continue
+                other_time, other_sig, other_nums, other_source = self.signatures[other]
+                if source == other_source and time != other_time:
+                    continue  # the same paper at another time: a recurring notice, not a re-listing
+                if (nums == other_nums and _days_apart(time, other_time) <= WINDOW_DAYS
+                        and similarity(sig, other_sig) >= THRESHOLD):
+                    matches.add(other)
+
+        self.signatures[key] = [time, sig, nums, source]
+        for band in band_keys(sig):
+            self.buckets.setdefault(band, []).append(key)
+        if matches:
+            self._join(key, time[:10], matches)
+        return True
+
+    def _join(self, key, date, matches):
+        # Merge every story the matches belong to into one, and add the newcomer
+        story_ids = sorted({self.story_of[m] for m in matches if m in self.story_of})
+        sid = story_ids[0] if story_ids else key
+        members = self.stories.setdefault(sid, {})
+        for other in story_ids[1:]:
+            members.update(self.stories.pop(other))
+        for m in matches:
+            members.setdefault(m, self.signatures[m][0][:10])
+        members[key] = date
+        for m in members:
+            self.story_of[m] = sid
+
+    def is_repeat(self, key):
+        """Whether the article is a later report of a story, one that cold
+        compaction drops."""
+        sid = self.story_of.get(key)
+        if sid is not None:
+            return first_report(self.stories[sid]) != key
+        return key in self.repeats
+
+    def forget_repeats(self, month):
+        """Drops the repeats of a 'YYYY-MM' month once it is compacted cold."""
+        for key in [k for k, date in self.repeats.items() if date[:7] == month]:
+            del self.repeats[key]
+
+    def prune(self, now=None):
+        """Forgets signatures too old to match anything new, and stories
+        that began before the same cutoff; their later reports move to
+        `repeats`. Returns the number of signatures dropped."""
+        cutoff = _cutoff(now)
+        old = [k for k, entry in self.signatures.items() if entry[0] < cutoff]
+        for key in old:
+            del self.signatures[key]
+        if old:
+            self._index_buckets()
+
+        for sid in [sid for sid, members in self.stories.items() if min(members.values()) < cutoff]:
+            members = self.stories.pop(sid)
+            first = first_report(members)
+            for key, date in members.items():
+                del self.story_of[key]
+                if key != first:
+                    self.repeats[key] = date
+        return len(old)
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': FORMAT, 'seq': self.seq, 'signatures': self.signatures,
+                       'stories': self.stories, 'repeats': self.repeats},
+                      f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def published(self, store, now=None):
+        """Stories with their member articles, newest story first. Only the
+        last KEEP_DAYS are read from the store: prune() drops older stories.
+
+        [{ id, representative: url, members: [{ url, title, source, date, municipalityId }] }]
+        Members are in first_report order, so the representative is the
+        first member whenever it is still stored.
+        """
+        if not self.stories:
+            return []
+        by_key = {article_key(a): a for a in store.load(_cutoff(now))}
+
+        stories = []
+        for sid, members in self.stories.items():
+            order = sorted(members, key=lambda k: (members[k], k))  # first_report first
+            articles = [by_key[k] for k in order if k in by_key]
+            if len(articles) < 2:
+                continue
+            stories.append({
+                'id': sid,
+                'representative': articles[0]['url'],
+                'members': [{field: a[field] for field in ('url', 'title', 'source', 'date', 'municipalityId')}
+                            for a in articles],
+            })
+        stories.sort(key=lambda s: s['members'][-1]['date'], reverse=True)
+        return stories
+
+
+def _cutoff(now=None):
+    return ((now or datetime.now()) - timedelta(days=KEEP_DAYS)).strftime('%Y-%m-%d')
+
+
+def _days_apart(a, b):
+    return abs((datetime.fromisoformat(a[:10]) - datetime.fromisoformat(b[:10])).days)
+
+
+def main():
+    from news_store import NewsStore
+
+    parser = argparse.ArgumentParser(description='Cluster archived articles into stories.')
+    parser.add_argument('--rebuild', action='store_true', help='start from an empty index')
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(INDEX_PATH):
+        os.remove(INDEX_PATH)
+    store = NewsStore('news_data')
+    index = StoryIndex(INDEX_PATH)
+    hashed = index.update(store)
+    index.prune()
+    stories = index.published(store)
+    print(f"Hashed {hashed} articles, {len(stories)} stories with more than one report")
+    for story in stories[:15]:
+        print(f"- {story['members'][0]['title']}")
+        for m in story['members'][1:]:
+            print(f"    {m['date'][:10]} {m['source']}: {m['title']}")
+    index.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Local stand-in for news.google.com/rss/search, for benchmarks and manual tests.
+
+Serves an RSS feed for any path. Knobs (all optional):
+    latency    seconds to wait before answering each request
+    fail_first answer the first N requests of every URL with 503
+    items      function(query) -> list of article dicts to put in the feed
+    body       function(query) -> raw feed bytes (e.g. recorded fixtures),
+               used instead of items and not kept in memory
+
+Supports ETag / If-None-Match so conditional fetches can be exercised.
+Article links (/rss/articles/<token>) redirect to /publisher/<token>, like
+Google News sends readers on to the publisher.
+
+    python stub_feed_server.py [port]
+"""
+import hashlib
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from email.utils import format_datetime
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+def make_rss(articles):
+    items = []
+    for a in articles:
+        date = datetime.fromisoformat(a['date']).astimezone()
+        items.append(
+            '<item>'
+            f'<title>{escape(a["title"])}</title>'
+            f'<link>{escape(a["url"])}</link>'
+            f'<guid isPermaLink="false">{escape(a["id"])}</guid>'
+            f'<pubDate>{format_datetime(date)}</pubDate>'
+            f'<description>{escape(a.get("content", ""))}</description>'
+            f'<source url="https://example.com">{escape(a["source"])}</source>'
+            '</item>'
+        )
+    return ('<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            '<title>stub</title>' + ''.join(items) + '</channel></rss>').encode('utf-8')
+
+
+def sample_items(query):
+    # A few synthetic articles mentioning the query
+    now = datetime.now().replace(microsecond=0)
+    return [{
+        'id': f'{query}-{i}',
+        'date': now.isoformat(),
+        'title': f'{query}でニュース {i} - 南海日日新聞',
+        'url': f'https://example.com/{urllib.parse.quote(query)}/{i}',
+        'content': f'{query}の話題',
+        'source': '南海日日新聞',
+    } for i in range(20)]
+
+
+def query_places(query):
+    # '"a" AND (...)' / '("a" OR "b") AND (...)' -> ['a', 'b']
+    return re.findall(r'"([^"]+)"', query) or [query]
+
+
+class StubFeedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, fail_first=0, items=sample_items, body=None):
+        super().__init__(('127.0.0.1', port), StubFeedHandler)
+        self.latency = latency
+        self.fail_first = fail_first
+        self.items = items
+        self.body = body
+        self.lock = threading.Lock()
+        self.request_counts = {}
+        self.connections = 0
+        self.bodies = {}
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def body_for(self, path):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query).get('q', [''])[0]
+        if self.body:
+            return self.body(query)
+        with self.lock:
+            if path not in self.bodies:
+                self.bodies[path] = make_rss(self.items(query))
+            return self.bodies[path]
+
+
+class StubFeedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is visible
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = urllib.parse.urlsplit(self.path).path
+        if path.startswith('/rss/articles/'):
+            token = path[len('/rss/articles/'):]
+            self._reply(302, b'', {'Location': f'{server.base_url}/publisher/{token}?utm_source=stub'})
+            return
+        if path.startswith('/publisher/'):
+            self._reply(200, b'<html><body>article</body></html>', {'Content-Type': 'text/html'})
+            return
+
+        with server.lock:
+            count = server.request_counts.get(self.path, 0) + 1
+            server.request_counts[self.path] = count
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if count <= server.fail_first:
+            self._reply(503, b'', {'Retry-After': '0'})
+            return
+
+        body = server.body_for(self.path)
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            self._reply(304, b'', {'ETag': etag})
+            return
+        self._reply(200, body, {'ETag': etag, 'Content-Type': 'application/rss+xml; charset=utf-8'})
+
+    def _reply(self, status, body, headers):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = StubFeedServer(port=port)
+    print(f"Stub feed server on {server.base_url}/rss/search?q=...")
+    server.serve_forever()
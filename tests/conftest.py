@@ -0,0 +1,10 @@
+import pytest
+
+from stub_feed_server import StubFeedServer
+
+
+@pytest.fixture
+def feed_server():
+    server = StubFeedServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,59 @@
+import async_fetch
+from async_fetch import BACKOFF_CAP, backoff_delay, fetch_feeds
+
+
+def feed(server, query='奄美'):
+    return f'{server.base_url}/rss/search?q={query}'
+
+
+def test_retries_until_the_feed_answers(feed_server):
+    feed_server.fail_first = 2
+    url = feed(feed_server)
+    result = fetch_feeds([url], retries=3)[url]
+
+    assert result.ok and result.status_code == 200
+    assert result.attempts == 3
+    assert b'<rss' in result.content
+
+
+def test_gives_up_after_the_last_retry(feed_server):
+    feed_server.fail_first = 5
+    url = feed(feed_server)
+    result = fetch_feeds([url], retries=2)[url]
+
+    assert not result.ok
+    assert result.error == 'HTTP 503'
+    assert result.attempts == 3
+    assert list(feed_server.request_counts.values()) == [3]
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    monkeypatch.setattr(async_fetch.random, 'uniform', lambda low, high: high)
+    assert backoff_delay(0) == async_fetch.BACKOFF_BASE
+    assert backoff_delay(2) == async_fetch.BACKOFF_BASE * 4
+    assert backoff_delay(20) == BACKOFF_CAP
+    # The server's Retry-After wins, within the same cap
+    assert backoff_delay(0, retry_after=3) == 3
+    assert backoff_delay(0, retry_after=600) == BACKOFF_CAP
+
+
+def test_conditional_fetch_gets_304_for_an_unchanged_feed(feed_server):
+    url = feed(feed_server)
+    first = fetch_feeds([url])[url]
+    etag = first.headers['ETag']
+
+    again = fetch_feeds([url], headers={url: {'If-None-Match': etag}})[url]
+    assert again.ok and again.status_code == 304
+    assert again.content == b''
+
+    stale = fetch_feeds([url], headers={url: {'If-None-Match': '"old"'}})[url]
+    assert stale.status_code == 200 and stale.headers['ETag'] == etag
+
+
+def test_connection_errors_are_reported_per_url(feed_server):
+    good = feed(feed_server)
+    bad = 'http://127.0.0.1:9/rss/search?q=x'
+    results = fetch_feeds([good, bad], retries=0)
+
+    assert results[good].ok
+    assert not results[bad].ok and results[bad].error.startswith('ConnectError')
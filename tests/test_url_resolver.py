@@ -0,0 +1,59 @@
+import base64
+
+from url_resolver import PROBE_LOOKUPS, UrlResolver, decode_token
+
+# Nothing listens here: every lookup fails to connect
+CLOSED = 'http://127.0.0.1:9'
+
+
+def token_for(url):
+    # An old-style token: protobuf framing around the publisher URL
+    return base64.urlsafe_b64encode(b'\x08\x13"\x2a' + url.encode('ascii') + b'\xd2\x01\x00').decode().rstrip('=')
+
+
+def test_decodes_old_tokens_without_a_request(tmp_path):
+    token = token_for('https://Example.com/news/1?utm_source=rss#top')
+    assert decode_token(token) == 'https://Example.com/news/1?utm_source=rss#top'
+
+    resolver = UrlResolver(str(tmp_path / 'cache.json'))
+    url = f'{CLOSED}/rss/articles/{token}?oc=5'
+    assert resolver.resolve([url]) == {url: 'https://example.com/news/1'}
+    assert resolver.lookups == 0
+
+
+def test_follows_the_redirect_of_opaque_tokens(tmp_path, feed_server):
+    path = str(tmp_path / 'cache.json')
+    url = f'{feed_server.base_url}/rss/articles/AU_yqLopaque?oc=5'
+    assert decode_token('AU_yqLopaque') is None
+
+    resolver = UrlResolver(path)
+    assert resolver.resolve([url]) == {url: f'{feed_server.base_url}/publisher/AU_yqLopaque'}
+    assert resolver.lookups == 1
+    resolver.save()
+
+    # The next run answers from the cache
+    again = UrlResolver(path)
+    assert again.resolve([url]) == {url: f'{feed_server.base_url}/publisher/AU_yqLopaque'}
+    assert (again.hits, again.lookups) == (1, 0)
+
+
+def test_failures_keep_the_link_and_are_not_retried_at_once(tmp_path):
+    url = f'{CLOSED}/rss/articles/AU_yqLgone'
+    resolver = UrlResolver(str(tmp_path / 'cache.json'))
+    assert resolver.resolve([url]) == {url: url}
+    assert resolver.entries['AU_yqLgone'][0] is None
+
+    assert resolver.resolve([url]) == {url: url}
+    assert (resolver.hits, resolver.lookups) == (1, 1)
+
+
+def test_stops_looking_up_when_the_first_lookups_all_fail(tmp_path):
+    urls = [f'{CLOSED}/rss/articles/AU_yqL{i}' for i in range(PROBE_LOOKUPS * 3)]
+    resolver = UrlResolver(str(tmp_path / 'cache.json'))
+    resolved = resolver.resolve(urls)
+
+    assert resolved == {url: url for url in urls}
+    assert resolver.given_up
+    assert resolver.lookups == PROBE_LOOKUPS
+    # The skipped links aren't cached as failures, so the next run tries them
+    assert len(resolver.entries) == PROBE_LOOKUPS
@@ -0,0 +1,213 @@
+"""Small local copies of article images, so clients don't hotlink them per view.
+
+Everything here is made at build time (render.yaml runs `python
+thumbnails.py`), never while serving: /api/thumb only looks thumbnails up.
+
+Each source image is fetched once, cropped to THUMB_SIZE and re-encoded
+(WebP, or JPEG if Pillow was built without it). The placehold.co
+placeholders the collector writes when a feed has no picture are replaced
+by one SVG per location, which the page links to directly; SVG text is
+drawn by the browser, so the server needs no Japanese font.
+
+    news_data/thumbs/
+        <sha256[:16]>.webp       content-addressed: identical images are stored once
+        refs/<blake2b(src)>      the digest a source URL maps to ('' = fetch failed)
+        placeholders/<id>.svg    the placeholder of a municipality / island
+
+Plain files rather than a JSON index: every gunicorn worker reads the
+cache, and os.replace keeps each ref consistent without a lock. File
+mtimes serve as last-use times; beyond MAX_BYTES the least recently used
+thumbnails are deleted.
+
+    python thumbnails.py     writes the placeholders, fetches the archive's new images
+"""
+import hashlib
+import io
+import os
+import time
+import urllib.parse
+from xml.sax.saxutils import escape
+
+from PIL import Image, ImageOps, features
+
+from article_table import PLACEHOLDER_IMAGE, PLACEHOLDER_PREFIX
+from locations import ISLANDS, MUNICIPALITIES
+from news_store import NewsStore, write_bytes
+from static_publish import content_hash
+
+THUMB_DIR = os.path.join('news_data', 'thumbs')
+PLACEHOLDER_DIR = os.path.join(THUMB_DIR, 'placeholders')
+THUMB_SIZE = (200, 140)           # the 100x70 card slot at 2x
+MAX_BYTES = 50 * 1024 * 1024
+MAX_SOURCE_BYTES = 5 * 1024 * 1024
+FETCH_TIMEOUT = 5
+RETRY_AFTER = 86400               # failed sources are tried again after a day
+BUILD_FETCHES = 500               # new source images fetched per build at most
+
+if features.check('webp'):
+    FORMAT, EXTENSION, MIMETYPE = 'WEBP', '.webp', 'image/webp'
+else:
+    FORMAT, EXTENSION, MIMETYPE = 'JPEG', '.jpg', 'image/jpeg'
+
+PLACEHOLDER_COLOR = '#0099c6'     # as in PLACEHOLDER_IMAGE
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">'
+    '<rect width="100%" height="100%" fill="{color}"/>'
+    '<text x="50%" y="50%" dy=".35em" text-anchor="middle" fill="#fff" font-size="{size}" '
+    'font-family="sans-serif">{text}</text></svg>\n'
+)
+
+
+def source_key(src):
+    return hashlib.blake2b(src.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def is_fetchable(src):
+    return urllib.parse.urlsplit(src).scheme in ('http', 'https')
+
+
+def make_thumbnail(data):
+    """Encoded thumbnail of an image file's bytes. Raises ValueError if it isn't one."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft('RGB', THUMB_SIZE)  # JPEG: decode at a reduced scale, much faster
+        image = ImageOps.fit(image.convert('RGB'), THUMB_SIZE, Image.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f'not a usable image: {e}') from e
+    return _encode(image)
+
+
+def placeholder_svg(text):
+    w, h = THUMB_SIZE
+    return PLACEHOLDER_SVG.format(w=w, h=h, color=PLACEHOLDER_COLOR, size=h // 3,
+                                  text=escape(text)).encode('utf-8')
+
+
+def write_placeholders(directory=PLACEHOLDER_DIR):
+    """One SVG per location; unchanged files are left alone. Returns how many were written."""
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for loc in MUNICIPALITIES + ISLANDS:
+        path = os.path.join(directory, f"{loc['id']}.svg")
+        data = placeholder_svg(loc['name'][:2])
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    continue
+        write_bytes(path, data)
+        written += 1
+    return written
+
+
+def _encode(image):
+    out = io.BytesIO()
+    if FORMAT == 'WEBP':
+        image.save(out, FORMAT, quality=75, method=6)
+    else:
+        image.save(out, FORMAT, quality=80, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+class ThumbnailCache:
+    """Content-addressed thumbnails on disk, looked up by source URL.
+    lookup() is all the web app does; fill() fetches and is for builds."""
+
+    def __init__(self, directory=THUMB_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.refs_dir = os.path.join(directory, 'refs')
+        os.makedirs(self.refs_dir, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + EXTENSION)
+
+    def _ref_path(self, src):
+        return os.path.join(self.refs_dir, source_key(src))
+
+    def lookup(self, src):
+        """(digest, path) of src's thumbnail if it has been made, else None. Never fetches."""
+        try:
+            with open(self._ref_path(src), 'r', encoding='ascii') as f:
+                digest = f.read()
+        except OSError:
+            return None
+        if digest and os.path.exists(self.path(digest)):
+            _touch(self.path(digest))
+            return digest, self.path(digest)
+        return None
+
+    def _wanted(self, src):
+        """Not made yet (or evicted), and not a recent failure."""
+        if src.startswith(PLACEHOLDER_PREFIX) or not is_fetchable(src) or self.lookup(src):
+            return False
+        try:
+            with open(self._ref_path(src), 'r', encoding='ascii') as f:
+                failed = not f.read()
+            return not (failed and time.time() - os.path.getmtime(self._ref_path(src)) < RETRY_AFTER)
+        except OSError:
+            return True
+
+    def fill(self, srcs, limit=BUILD_FETCHES):
+        """Fetches and makes the thumbnails srcs lack, up to `limit` sources.
+        Returns (made, failed)."""
+        from async_fetch import fetch_feeds  # pulls in httpx; builds only
+
+        wanted = [src for src in dict.fromkeys(srcs) if self._wanted(src)][:limit]
+        results = fetch_feeds(wanted, timeout=FETCH_TIMEOUT, retries=1)
+        made = failed = 0
+        for src in wanted:
+            result = results[src]
+            data = None
+            if result.ok and result.status_code == 200 and len(result.content) <= MAX_SOURCE_BYTES:
+                try:
+                    data = make_thumbnail(result.content)
+                except ValueError as e:
+                    print(f"Thumbnail for {src} failed: {e}")
+            digest = content_hash(data) if data else ''
+            if data and not os.path.exists(self.path(digest)):
+                write_bytes(self.path(digest), data)
+            write_bytes(self._ref_path(src), digest.encode('ascii'))
+            made, failed = (made + 1, failed) if data else (made, failed + 1)
+        self.evict()
+        return made, failed
+
+    def evict(self):
+        """Deletes the least recently used thumbnails beyond max_bytes.
+        Their refs stay and point nowhere, so the source is fetched again if asked for."""
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(EXTENSION):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        files.sort()
+        removed = 0
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # another worker got there first
+            total -= size
+            removed += 1
+        return removed
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def main():
+    print(f"Placeholders: {write_placeholders()} written to {PLACEHOLDER_DIR}")
+    articles = NewsStore('news_data').load()
+    made, failed = ThumbnailCache().fill(a['imageUrl'] for a in articles if a.get('imageUrl'))
+    print(f"Thumbnails: {made} made, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
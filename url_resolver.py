@@ -0,0 +1,155 @@
+import base64
+import json
+import os
+import re
+import time
+import urllib.parse
+
+CACHE_PATH = os.path.join('news_data', 'url_cache.json')
+
+# Entries kept in the cache file; the least recently used go first
+MAX_ENTRIES = 20000
+# New lookups per run, so a cold cache doesn't turn one run into thousands of requests
+MAX_LOOKUPS = 300
+# Lookups tried first in a run; if none of them resolves, the rest of the
+# run skips lookups (current Google News pages neither redirect nor carry
+# data-n-au, so every request would fail)
+PROBE_LOOKUPS = 5
+# Links that couldn't be resolved are tried again after this long
+RETRY_AFTER = 7 * 86400
+
+ARTICLE_PATH = '/rss/articles/'
+# Older article pages carried the publisher URL in this attribute
+PAGE_URL = re.compile(rb'data-n-au="([^"]+)"')
+EMBEDDED_URL = re.compile(rb'https?://[\x21-\x7e]+')
+TRACKING_PREFIXES = ('utm_',)
+TRACKING_PARAMS = {'oc', 'ref', 'fbclid', 'gclid'}
+
+
+def is_redirect_url(url):
+    """Google News article link (or the stub server's copy of one)."""
+    return urllib.parse.urlsplit(url).path.startswith(ARTICLE_PATH)
+
+
+def article_token(url):
+    return urllib.parse.urlsplit(url).path[len(ARTICLE_PATH):]
+
+
+def decode_token(token):
+    """Publisher URL embedded in an old-style CBMi... token, or None.
+
+    Newer tokens only wrap an opaque id; those need a request.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        return None
+    match = EMBEDDED_URL.search(raw)
+    if not match:
+        return None
+    return match.group(0).decode('ascii')
+
+
+def normalize_url(url):
+    """Drops fragments and tracking parameters, lowercases the host."""
+    parts = urllib.parse.urlsplit(url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith(TRACKING_PREFIXES) and k.lower() not in TRACKING_PARAMS]
+    return urllib.parse.urlunsplit((
+        parts.scheme.lower(), parts.netloc.lower(), parts.path or '/',
+        urllib.parse.urlencode(query), '',
+    ))
+
+
+class UrlResolver:
+    """Maps Google News article tokens to canonical publisher URLs, kept between runs.
+
+    Stored as JSON keyed by token:
+        { token: [canonical url or null, last used (epoch s)] }
+    A token is decoded locally when it embeds the URL, otherwise the link is
+    followed once. Failures are remembered (null) and retried after
+    RETRY_AFTER. When the first PROBE_LOOKUPS of a run all fail, the
+    resolver stops following links until the next run; those links are
+    tried again then. Beyond MAX_ENTRIES the least recently used tokens are
+    dropped.
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, max_lookups=MAX_LOOKUPS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_lookups = max_lookups
+        self.entries = {}
+        self.hits = 0
+        self.lookups = 0
+        self.found = 0          # lookups that resolved this run
+        self.given_up = False
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print(f"URL cache {path} was unreadable, starting fresh.")
+                self.entries = {}
+
+    def resolve(self, urls):
+        """Returns { url: canonical url } for every url; unresolved ones map to themselves."""
+        now = int(time.time())
+        resolved = {}
+        pending = {}
+        for url in urls:
+            if not is_redirect_url(url):
+                resolved[url] = normalize_url(url)
+                continue
+            token = article_token(url)
+            cached = self.entries.get(token)
+            if cached and (cached[0] or now - cached[1] < RETRY_AFTER):
+                self.hits += 1
+                cached[1] = now
+                resolved[url] = cached[0] or url
+                continue
+            decoded = decode_token(token)
+            if decoded:
+                self.entries[token] = [normalize_url(decoded), now]
+                resolved[url] = self.entries[token][0]
+                continue
+            pending[url] = token
+
+        # Follow the rest, a bounded number per run; a few at a time until one works
+        lookup = list(pending.items())[:self.max_lookups]
+        while lookup and not self.given_up:
+            size = len(lookup) if self.found else PROBE_LOOKUPS
+            batch, lookup = dict(lookup[:size]), lookup[size:]
+            from async_fetch import fetch_feeds
+            results = fetch_feeds(list(batch), retries=1)
+            self.lookups += len(batch)
+            for url, token in batch.items():
+                canonical = _canonical_from(results[url])
+                self.entries[token] = [canonical, now]
+                self.found += canonical is not None
+            if not self.found and self.lookups >= PROBE_LOOKUPS:
+                self.given_up = True
+                print(f"URL lookups: none of the first {self.lookups} resolved, skipping the rest this run")
+        for url in pending:
+            cached = self.entries.get(pending[url])
+            resolved[url] = (cached and cached[0]) or url
+        return resolved
+
+    def save(self):
+        if len(self.entries) > self.max_entries:
+            newest = sorted(self.entries.items(), key=lambda kv: kv[1][1], reverse=True)
+            self.entries = dict(newest[:self.max_entries])
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=0)
+        os.replace(tmp_path, self.path)
+
+
+def _canonical_from(result):
+    if not result.ok:
+        return None
+    if not is_redirect_url(result.final_url):
+        return normalize_url(result.final_url)
+    match = PAGE_URL.search(result.content)
+    if match:
+        return normalize_url(match.group(1).decode('utf-8', 'replace'))
+    return None